@@ -0,0 +1,97 @@
+'''Command line tool for MG-ALFA models
+
+pandas is only imported by the commands that need DataFrames (build-aia and export), so listing runs, checking
+the lock and reading metadata start quickly enough for cron jobs and CI scripts.
+
+Examples:
+  List the runs of a model, wait for ALFA to finish with it, and export the output of two runs::
+
+    python -m pyalfa runs P:/2020/083120/Assets_083120.ain2
+    python -m pyalfa locked P:/2020/083120/Assets_083120.ain2 || echo "In use"
+    python -m pyalfa export P:/2020/083120/Assets_083120.ain2 output.csv --runs 1 2
+'''
+import sys, os, json, argparse
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+from base import Model, Asset
+
+def runs(args):
+  m = Model(args.model)
+  if args.json:
+    print(json.dumps(m.runs))
+  else:
+    print('\n'.join(m.runs))
+  return 0
+
+def locked(args):
+  is_locked = Model(args.model).locked
+  print('locked' if is_locked else 'unlocked')
+  return 1 if is_locked else 0
+
+def metadata(args):
+  m = Model(args.model)
+  print(json.dumps({r: m.run(r).metadata for r in (args.runs or m.runs)}, indent=2))
+  return 0
+
+def build_aia(args):
+  asset = Asset(args.asset, Model(args.model))
+  asset.segment_column = args.segment_column
+  if args.out:
+    asset.output_dest = args.out
+  manifest = asset.build_stream(args.data, args.segments or 'all', args.chunksize, args.workers)
+  print(manifest.to_string(index=False))
+  return 0
+
+def export(args):
+  df, errors = Model(args.model).load_runs(args.runs, args.workers, args.columns)
+  df.to_csv(args.out, sep='\t' if args.out.lower().endswith('.txt') else ',', index=False)
+  for r, e in errors.items():
+    print('Run %s: %s'%(r, e), file=sys.stderr)
+  return 1 if errors else 0
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(prog='pyalfa', description=__doc__.split('\n')[0])
+  commands = parser.add_subparsers(dest='command')
+  commands.required = True
+
+  p = commands.add_parser('runs', help='List the runs of a model')
+  p.add_argument('model', help='Path to the model (*.ain2) or its directory')
+  p.add_argument('--json', action='store_true', help='Print a JSON list')
+  p.set_defaults(func=runs)
+
+  p = commands.add_parser('locked', help='Whether the model is open in ALFA. Exits with 1 when it is.')
+  p.add_argument('model', help='Path to the model (*.ain2) or its directory')
+  p.set_defaults(func=locked)
+
+  p = commands.add_parser('metadata', help='Print the metadata of runs as JSON')
+  p.add_argument('model', help='Path to the model (*.ain2) or its directory')
+  p.add_argument('runs', nargs='*', help='Runs to show. Default is every run.')
+  p.set_defaults(func=metadata)
+
+  p = commands.add_parser('build-aia', help='Build AIA files from a CSV or Parquet file')
+  p.add_argument('model', help='Path to the model (*.ain2) or its directory')
+  p.add_argument('data', help='CSV or Parquet file of asset data')
+  p.add_argument('--asset', default='Bond', help='Asset type, as named in AIA_Definitions.JSON')
+  p.add_argument('--out', help='Where to write the files. Default is the model directory.')
+  p.add_argument('--segments', nargs='*', help='Segments to build. Default is every segment.')
+  p.add_argument('--segment-column', default='segment', help='Column the files are split by')
+  p.add_argument('--chunksize', type=int, default=100000, help='Rows to read at a time')
+  p.add_argument('--workers', type=int, help='Files to append to at once')
+  p.set_defaults(func=build_aia)
+
+  p = commands.add_parser('export', help='Write the output of runs to one CSV (or tab separated .txt) file')
+  p.add_argument('model', help='Path to the model (*.ain2) or its directory')
+  p.add_argument('out', help='File to write')
+  p.add_argument('--runs', nargs='*', help='Runs to export. Default is every run.')
+  p.add_argument('--columns', nargs='*', help='Output columns to keep')
+  p.add_argument('--workers', type=int, help='Runs to read at once')
+  p.set_defaults(func=export)
+
+  args = parser.parse_args(argv)
+  try:
+    return args.func(args)
+  except (ValueError, OSError) as e:
+    print('pyalfa: %s'%e, file=sys.stderr)
+    return 2
+
+if __name__=="__main__":
+  sys.exit(main())
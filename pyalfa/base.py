@@ -1,6 +1,1422 @@
-import sys, os, json, glob, re
+import sys, os, json, glob, re, time, mmap, shutil, hashlib, csv, tempfile, zipfile
+import concurrent.futures, functools, threading, weakref, warnings, numbers
+import sqlite3
+from collections.abc import Mapping
 import xml.etree.ElementTree as ET
-import pandas as pd
+import importlib
+
+class _LazyModule:
+  '''Stand-in for a module that is only imported when first used
+
+  Importing pandas and NumPy takes most of a second, which commands that only list files or read metadata
+  should not pay. The first attribute looked up imports the module and puts it in place of the stand-in.
+  '''
+  def __init__(self, name, alias):
+    self.__name = name
+    self.__alias = alias
+
+  def __getattr__(self, attr):
+    module = importlib.import_module(self.__name)
+    globals()[self.__alias] = module
+    return getattr(module, attr)
+
+asyncio = _LazyModule('asyncio', 'asyncio')
+np = _LazyModule('numpy', 'np')
+pd = _LazyModule('pandas', 'pd')
+
+class Instrumentation:
+  '''Opt-in timing and I/O statistics of Model, Run and Asset operations
+
+  While enabled, each call of an instrumented operation records its wall time, bytes read and written,
+  rows processed and files touched. Records are kept for stats() and passed to every hook as they are made,
+  e.g. to send them on to a metrics system.
+
+  Examples:
+    Time a build and see where the time went::
+
+      import pyalfa.base as mg
+      mg.instrumentation.enable()
+      mg.instrumentation.add_hook(lambda record: print(record))
+      ...
+      mg.instrumentation.stats()
+  '''
+  counters = ('bytes_read', 'bytes_written', 'rows', 'files')
+
+  def __init__(self):
+    self.enabled = False
+    self.records = []
+    self.__hooks = []
+    self.__local = threading.local()
+    self.__lock = threading.Lock()
+
+  def enable(self):
+    self.enabled = True
+
+  def disable(self):
+    self.enabled = False
+
+  def reset(self):
+    '''Forget the records kept so far'''
+    with self.__lock:
+      self.records = []
+
+  def add_hook(self, hook):
+    '''Call hook(record) with the record (a dict) of every instrumented call, as it finishes
+
+    A hook that raises is reported with a warning, and does not change the result of the call.
+    '''
+    self.__hooks.append(hook)
+
+  def remove_hook(self, hook):
+    self.__hooks.remove(hook)
+
+  def _stack(self):
+    if not hasattr(self.__local, 'stack'):
+      self.__local.stack = []
+    return self.__local.stack
+
+  def record(self, **counts):
+    '''Add to the counters of the calls in progress on this thread'''
+    if self.enabled:
+      for rec in self._stack():
+        for k, v in counts.items():
+          rec[k] += int(v)
+
+  def call(self, operation, fn, *args, **kwargs):
+    '''Run fn, recording it as a call of operation'''
+    rec = dict({'operation': operation, 'seconds': 0.0}, **{k: 0 for k in self.counters})
+    stack = self._stack()
+    stack.append(rec)
+    start = time.perf_counter()
+    try:
+      return fn(*args, **kwargs)
+    finally:
+      rec['seconds'] = time.perf_counter() - start
+      stack.pop()
+      with self.__lock:
+        self.records.append(rec)
+      for hook in list(self.__hooks):
+        try:
+          hook(rec)
+        except Exception as e:
+          warnings.warn('Instrumentation hook %r failed on %s: %r'%(hook, operation, e), RuntimeWarning)
+
+  def stats(self):
+    '''Records aggregated by operation
+
+    Returns:
+      DataFrame indexed by operation with the number of calls, total/mean/max seconds and total counters
+    '''
+    df = pd.DataFrame(self.records, columns=['operation', 'seconds'] + list(self.counters))
+    agg = {'calls': ('seconds', 'size'), 'seconds': ('seconds', 'sum'), 'mean_seconds': ('seconds', 'mean'), 'max_seconds': ('seconds', 'max')}
+    agg.update({k: (k, 'sum') for k in self.counters})
+    return df.groupby('operation').agg(**agg)
+
+# Statistics of the instrumented operations, off until enabled
+instrumentation = Instrumentation()
+
+def _instrumented(operation):
+  '''Decorator recording calls of a method with instrumentation, when it is enabled
+
+  A %s in operation is replaced by the name of the instance's class, so methods inherited by several classes
+  (e.g. '%s.build' for Asset and Liability) are recorded apart.
+  '''
+  def decorator(fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+      if not instrumentation.enabled:
+        return fn(*args, **kwargs)
+      name = operation%type(args[0]).__name__ if '%s' in operation else operation
+      return instrumentation.call(name, fn, *args, **kwargs)
+    return wrapper
+  return decorator
+
+def _get_executor(workers=None, executor='thread'):
+  '''Create the pool used to spread file work over several workers
+
+  Args:
+    workers (int): Maximum number of workers. None lets the pool decide.
+    executor (str): Either 'thread' or 'process'
+
+  Returns:
+    A concurrent.futures executor
+  '''
+  if executor == 'thread':
+    return concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+  elif executor == 'process':
+    return concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+  else:
+    raise ValueError("executor must be 'thread' or 'process', not '%s'"%executor)
+
+def _split_segments(df, segments):
+  '''Split a frame into one frame per segment in a single pass
+
+  Rows keep their original order within each segment, and segments are returned in order of first appearance.
+
+  Args:
+    df: DataFrame to split
+    segments: Series of segment values, aligned with the rows of df
+
+  Returns:
+    dict of segment (as str) to DataFrame
+  '''
+  uniques, order, starts, bounds = _segment_order(segments)
+  return {seg: df.iloc[order[start:end]] for seg, start, end in zip(uniques, starts, bounds)}
+
+def _segment_order(segments):
+  '''Positions of rows grouped by segment, keeping their order within each segment
+
+  Returns:
+    Tuple of the segments (as str) in order of first appearance, the row positions, and where each segment starts and ends in them
+  '''
+  codes, uniques = pd.factorize(pd.Series(segments).astype(str))
+  # Stable sort of the segment codes groups the rows without disturbing their order
+  valid = np.flatnonzero(codes >= 0)
+  order = valid[np.argsort(codes[valid], kind='stable')]
+  bounds = np.cumsum(np.bincount(codes[valid], minlength=len(uniques)))
+  starts = np.concatenate(([0], bounds[:-1]))
+  return uniques, order, starts, bounds
+
+def _segment_hashes(df, segments, version):
+  '''Hash of the rows of each segment, in order, along with a version string of everything else the files depend on
+
+  Rows are hashed all at once with pandas, leaving one digest per segment to take.
+
+  Returns:
+    dict of segment (as str) to hex digest
+  '''
+  rows = pd.util.hash_pandas_object(df, index=False).to_numpy()
+  uniques, order, starts, bounds = _segment_order(segments)
+  rows = rows[order]
+  hashes = {}
+  for seg, start, end in zip(uniques, starts, bounds):
+    h = hashlib.blake2b(version.encode('utf-8'), digest_size=16)
+    h.update(rows[start:end].tobytes())
+    hashes[seg] = h.hexdigest()
+  return hashes
+
+def _find_file(directory, filename):
+  '''Path to filename within directory, matching its case loosely like Windows does'''
+  if not os.path.exists(os.path.join(directory, filename)) and os.path.isdir(directory):
+    for f in os.listdir(directory):
+      if f.lower() == filename.lower():
+        return os.path.join(directory, f)
+  return os.path.join(directory, filename)
+
+# Parsed definitions files, keyed by path and holding the mtime they were parsed at
+_definitions_cache = {}
+
+def _load_definitions(path):
+  '''Parse a definitions file once, reusing the result until the file changes
+
+  Returns:
+    dict of the parsed definitions, with a compiled plan per asset type under '_plans'
+  '''
+  path = os.path.abspath(path)
+  mtime = os.stat(path).st_mtime_ns
+  cached = _definitions_cache.get(path)
+  if cached is None or cached[0] != mtime:
+    with open(path, 'r') as f:
+      defs = json.load(f)
+    cached = (mtime, {'defs': defs, 'plans': {}})
+    _definitions_cache[path] = cached
+  return cached[1]
+
+def _compile_plan(fields):
+  '''Turn the field definitions of one asset type into a list of column transforms
+
+  Each step is a tuple of (field, source, literal, format, arg) in the order of the field's Index.
+  A Value of the form [column] reads the source column, anything else is written as a literal.
+  '''
+  plan = []
+  for field, spec in sorted(fields.items(), key=lambda kv: int(kv[1]['Index'])):
+    value = str(spec.get('Value', ''))
+    m = re.fullmatch(r'\[(.+)\]', value)
+    source, literal = (m[1], None) if m else (None, value)
+
+    fmt = str(spec.get('Format', 'None'))
+    pad = re.fullmatch(r'ZeroPad\((\d+)\)', fmt)
+    if pad:
+      plan.append((field, source, literal, 'ZeroPad', int(pad[1])))
+    elif fmt in ('None', 'Integer', 'Date'):
+      plan.append((field, source, literal, fmt, None))
+    else:
+      raise ValueError('Unknown Format "%s" for field "%s"'%(fmt, field))
+  return plan
+
+def _format_integer(s):
+  '''Render a column as whole numbers, leaving missing values blank'''
+  num = pd.to_numeric(s, errors='coerce')
+  out = num.round().astype('Int64').astype(str)
+  return out.mask(num.isna(), '')
+
+def _by_unique(s, fn):
+  '''Apply fn to the distinct values of a column only, spreading the results back over its rows
+
+  Asset data repeats a lot of values (dates in particular), so this saves most of the work of slow conversions.
+  Missing values are passed to fn as well, as the last value.
+  '''
+  codes, uniques = pd.factorize(s)
+  values = fn(pd.Series(uniques).reindex(range(len(uniques) + 1)))
+  return pd.Series(np.asarray(values, dtype=object)[codes], index=s.index)
+
+def _blank(u):
+  '''Whether each value is missing or, for text, empty'''
+  if pd.api.types.is_numeric_dtype(u) or pd.api.types.is_datetime64_any_dtype(u):
+    return u.isna().to_numpy(dtype=bool)
+  return (u.isna() | (u.astype(str).str.strip() == '')).to_numpy(dtype=bool)
+
+def _to_dates(u):
+  '''Parse each value as a date on its own, so a column mixing layouts (e.g. 2020-08-31 and 08/31/2020) is read whole.
+  Values that are not dates become NaT.'''
+  # pandas 2 otherwise guesses one format from the first value and applies it to the rest
+  mixed = {'format': 'mixed'} if int(pd.__version__.split('.')[0]) >= 2 else {}
+  return pd.to_datetime(u, errors='coerce', **mixed)
+
+def _format_dates(u, date_format):
+  dates = _to_dates(u)
+  bad = dates.isna().to_numpy() & ~_blank(u)
+  if bad.any():
+    raise ValueError('Could not read as dates: %s'%', '.join(repr(v) for v in u[bad][:5]))
+  return dates.dt.strftime(date_format)
+
+def _id_string(x):
+  if isinstance(x, numbers.Real) and not isinstance(x, bool) and float(x).is_integer():
+    return str(int(x))
+  return str(x)
+
+def _id_strings(s):
+  '''Identifiers as strings, with whole numbers written without a decimal point
+
+  So 5, np.int64(5), 5.0 (e.g. from a column of ids with a blank) and '5' are all the same identifier.
+  '''
+  if pd.api.types.is_integer_dtype(s) or pd.api.types.infer_dtype(s, skipna=True) == 'string':
+    # Nothing to normalise
+    return s.astype(str)
+  return _by_unique(s, lambda u: u.map(_id_string))
+
+def _format_column(s, fmt, arg, date_format):
+  '''Apply a field's Format to a column'''
+  if fmt == 'Integer':
+    s = _format_integer(s)
+  elif fmt == 'ZeroPad':
+    s = _format_integer(s)
+    s = s.str.zfill(arg).mask(s == '', '')
+  elif fmt == 'Date':
+    s = _by_unique(s, lambda u: _format_dates(u, date_format))
+  return s
+
+def _apply_plan(plan, df, date_format):
+  '''Map the source columns of df into the AIA layout, one column at a time'''
+  missing = sorted({step[1] for step in plan if step[1] is not None and step[1] not in df.columns})
+  if missing:
+    raise KeyError('Data is missing columns needed by the definitions: %s'%', '.join(missing))
+
+  cols = {}
+  for field, source, literal, fmt, arg in plan:
+    s = df[source] if source is not None else pd.Series(literal, index=df.index)
+    try:
+      cols[field] = _format_column(s, fmt, arg, date_format)
+    except ValueError as e:
+      raise ValueError('%s: %s'%(field, e))
+  return pd.DataFrame(cols, index=df.index)
+
+def _check_column(s, fmt, arg, width, date_format):
+  '''Rules broken by the values of a column, checked once per distinct value
+
+  Returns:
+    dict of rule to the positions of the rows breaking it
+  '''
+  codes, uniques = pd.factorize(s)
+  u = pd.Series(uniques)
+  text = not (pd.api.types.is_numeric_dtype(u) or pd.api.types.is_datetime64_any_dtype(u))
+  present = ~_blank(u)
+
+  rules = {}
+  if fmt in ('Integer', 'ZeroPad'):
+    num = pd.to_numeric(u, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    with np.errstate(invalid='ignore'):
+      whole = np.isfinite(num) & (num == np.round(num))
+      rules['integer'] = present & ~whole
+      if fmt == 'ZeroPad':
+        rules['zeropad'] = whole & ((num < 0) | (num >= 10.0 ** arg))
+  elif fmt == 'Date':
+    rules['date'] = present & _to_dates(u).isna().to_numpy()
+  if width is not None:
+    # Values already found to be bad dates are not measured again
+    measured = u.mask(rules['date']) if 'date' in rules else u
+    rules['width'] = (_format_column(measured, fmt, arg, date_format).str.len() > width).to_numpy(dtype=bool)
+  if text:
+    rules['delimiter'] = u.astype(str).str.contains('[\t\r\n]').to_numpy(dtype=bool)
+
+  # Missing values (code -1) break no rule
+  return {rule: np.flatnonzero(np.append(bad, False)[codes]) for rule, bad in rules.items() if bad.any()}
+
+def _validate_plan(plan, widths, df, date_format):
+  '''Check df against every field of a plan, see _InputFile.validate'''
+  found = []
+  for order, (field, source, literal, fmt, arg) in enumerate(plan):
+    if source is not None and source not in df.columns:
+      found.append(pd.DataFrame({'pos': [-1], 'order': order, 'row': [None], 'field': field, 'rule': 'missing column', 'value': [source]}))
+      continue
+    s = df[source] if source is not None else pd.Series([literal])
+    for rule, pos in _check_column(s, fmt, arg, widths.get(field), date_format).items():
+      found.append(pd.DataFrame({
+        'pos': pos if source is not None else -1
+        ,'order': order
+        ,'row': df.index[pos] if source is not None else [None]
+        ,'field': field
+        ,'rule': rule
+        ,'value': s.iloc[pos].astype(str).to_numpy()
+      }))
+  if not found:
+    return pd.DataFrame({'row': [], 'field': [], 'rule': [], 'value': []})
+  errors = pd.concat(found, ignore_index=True)
+  # Errors of a whole field first, then by row
+  errors = errors.sort_values(['pos', 'order'], kind='stable')
+  return errors[['row', 'field', 'rule', 'value']].reset_index(drop=True)
+
+def _iter_chunks(source, chunksize, **kwargs):
+  '''Yield DataFrames from a CSV/Parquet path, a DataFrame or an iterator of DataFrames'''
+  if isinstance(source, pd.DataFrame):
+    yield source
+  elif isinstance(source, str):
+    if source.lower().endswith(('.parquet', '.pq')):
+      import pyarrow.parquet as pq
+      for batch in pq.ParquetFile(source).iter_batches(batch_size=chunksize):
+        yield batch.to_pandas()
+    else:
+      for chunk in pd.read_csv(source, chunksize=chunksize, **kwargs):
+        yield chunk
+  else:
+    for chunk in source:
+      yield chunk
+
+# Folder, within the folder of the file being cached, that holds pyalfa's caches
+CACHE_DIR = '.pyalfa'
+
+def _cache_path(path, suffix):
+  '''Where to cache a file's parsed contents, keyed on its size and mtime'''
+  st = os.stat(path)
+  directory, filename = os.path.split(path)
+  return os.path.join(directory, CACHE_DIR, '%s.%d.%d%s'%(filename, st.st_size, st.st_mtime_ns, suffix))
+
+def _save_frame(df, path):
+  '''Save a DataFrame as a .npz of one array per column, which loads without unpickling anything
+
+  Caches live on shared drives, so they must not be able to run code when read. Numeric, boolean and date columns are
+  kept as they are and text columns as fixed width strings with a mask of missing values. Other columns (e.g. mixed
+  types) raise TypeError.
+  '''
+  if not df.index.equals(pd.RangeIndex(len(df))):
+    raise TypeError('Only frames with a default index are cached')
+  arrays, dtypes = {}, []
+  for i in range(df.shape[1]):
+    s = df.iloc[:, i]
+    if isinstance(s.dtype, np.dtype) and s.dtype.kind in 'biufcmM':
+      arrays['c%d'%i] = s.to_numpy()
+    elif pd.api.types.infer_dtype(s, skipna=True) in ('string', 'empty'):
+      missing = s.isna().to_numpy()
+      arrays['c%d'%i] = np.where(missing, '', s.to_numpy(dtype=object)).astype(str)
+      arrays['m%d'%i] = missing
+    else:
+      raise TypeError('Column %r cannot be cached'%(df.columns[i],))
+    dtypes.append(str(s.dtype))
+  arrays['meta'] = np.array(json.dumps({'columns': list(df.columns), 'dtypes': dtypes}))
+  with open(path, 'wb') as f:
+    np.savez(f, **arrays)
+
+def _load_frame(path):
+  '''Load a DataFrame saved by _save_frame'''
+  with np.load(path, allow_pickle=False) as z:
+    meta = json.loads(str(z['meta']))
+    cols = {}
+    for i, dtype in enumerate(meta['dtypes']):
+      values = z['c%d'%i]
+      if 'm%d'%i in z.files:
+        values = pd.Series(values.astype(object)).mask(z['m%d'%i]).astype(dtype)
+      cols[i] = values
+  df = pd.DataFrame(cols)
+  df.columns = meta['columns']
+  return df
+
+def _read_cache(path, suffix):
+  '''The cached frame of path, or None when there is none for this version of the file or it cannot be read'''
+  try:
+    cache = _cache_path(path, suffix)
+    df = _load_frame(cache)
+  except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+    return None
+  instrumentation.record(bytes_read=os.path.getsize(cache))
+  return df
+
+def _write_cache(path, suffix, df):
+  '''Save df as the cache of path, replacing caches of earlier versions of the file
+
+  Failing to write (e.g. on a read-only share, or for a frame that cannot be saved safely) is not an error, the file
+  is just parsed again next time.
+  '''
+  cache = _cache_path(path, suffix)
+  try:
+    os.makedirs(os.path.dirname(cache), exist_ok=True)
+    for old in glob.glob(os.path.join(os.path.dirname(cache), glob.escape(os.path.basename(path)) + '.*' + suffix)):
+      os.remove(old)
+    # Written aside then renamed, so readers never see half a file
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(cache))
+    os.close(fd)
+    try:
+      _save_frame(df, tmp)
+      os.replace(tmp, cache)
+    finally:
+      if os.path.exists(tmp):
+        os.remove(tmp)
+  except (OSError, TypeError):
+    pass
+
+def _apply_dtype(df, dtype):
+  '''Apply a dtype schema: a dict of column to dtype, or 'float32' to downcast every float column'''
+  if dtype is None:
+    return df
+  if isinstance(dtype, str):
+    if dtype != 'float32':
+      raise ValueError("dtype should be a dict of column dtypes or 'float32', not '%s'"%dtype)
+    dtype = {col: 'float32' for col in df.columns if df[col].dtype == 'float64'}
+  return df.astype({col: t for col, t in dtype.items() if col in df.columns})
+
+def _read_output(path, columns=None, dtype=None, cache=True):
+  '''Read a tab-delimited ALFA output file
+
+  With cache, the parsed file is kept in a binary sidecar next to it and read from there while the file is unchanged.
+
+  Args:
+    path (str): Output file
+    columns (optional list): Columns to keep
+    dtype (optional): dict of column to dtype (e.g. 'float32' or 'category'), or 'float32' for every float column
+    cache (optional bool): Whether to use and keep the binary sidecar
+  '''
+  if not cache:
+    df = pd.read_csv(path, sep = '\t', usecols=columns, dtype=dtype if isinstance(dtype, dict) else None)
+    instrumentation.record(bytes_read=os.path.getsize(path))
+  else:
+    df = _read_cache(path, '.npz')
+    if df is None:
+      df = pd.read_csv(path, sep = '\t')
+      instrumentation.record(bytes_read=os.path.getsize(path))
+      _write_cache(path, '.npz', df)
+    if columns is not None:
+      df = df[list(columns)]
+  instrumentation.record(rows=len(df), files=1)
+  return _apply_dtype(df, dtype)
+
+def _output_key(keys):
+  '''Which of a run's reports is its output: one ALFA projections usually produce, or else the only one'''
+  for k in ('006.Subtotal001', '010.Total002'):
+    if k in keys:
+      return k
+  return next(iter(keys)) if len(keys)==1 else None
+
+def _default_columns(df, keys=None, columns=None):
+  '''Key and value columns of an output: keys default to the non-float columns, values to the other numeric ones'''
+  if keys is None:
+    keys = [c for c in df.columns if not pd.api.types.is_float_dtype(df[c])]
+  keys = list(keys)
+  if columns is None:
+    columns = [c for c in df.columns if c not in keys and pd.api.types.is_numeric_dtype(df[c])]
+  return keys, list(columns)
+
+def _compare_frames(base, other, keys=None, columns=None, tolerance=0.0, rel_tolerance=0.0):
+  '''Align two frames on their key columns and report the cells that differ
+
+  Rows are matched through one factorization of the keys of both frames, then every value column is
+  differenced at once as a 2-D array.
+  '''
+  given = columns is not None
+  keys, columns = _default_columns(base, keys, columns)
+  if not given:
+    columns = [c for c in columns if c in other.columns]
+  for df, label in ((base, 'base'), (other, 'other')):
+    missing = [c for c in keys + columns if c not in df.columns]
+    if missing:
+      raise KeyError('%s output is missing columns: %s'%(label, ', '.join(map(str, missing))))
+
+  # Factorize each key column over both frames and fold the codes into one integer per row,
+  # whose factorization gives every row a position in the union of the keys
+  n = len(base) + len(other)
+  codes = np.zeros(n, dtype=np.int64)
+  size = 1
+  values = {}
+  for k in keys:
+    values[k] = np.concatenate([base[k].to_numpy(), other[k].to_numpy()])
+    c, u = pd.factorize(values[k])
+    if size * (len(u) + 1) >= 2**62:
+      # Compact the codes so far before they can overflow
+      codes, u_codes = pd.factorize(codes)
+      size = len(u_codes)
+    codes = codes * (len(u) + 1) + c + 1
+    size *= len(u) + 1
+  codes, uniques = pd.factorize(codes)
+  codes_base, codes_other = codes[:len(base)], codes[len(base):]
+  # First row (of base then other) holding each key, to read the keys of breaks back from
+  first = np.empty(len(uniques), dtype=np.int64)
+  first[codes[::-1]] = np.arange(n - 1, -1, -1)
+  for c, label in ((codes_base, 'base'), (codes_other, 'other')):
+    if len(c) and np.bincount(c).max() > 1:
+      raise ValueError('Keys %s do not identify the rows of the %s output uniquely'%(keys, label))
+
+  a = np.full((len(uniques), len(columns)), np.nan)
+  b = np.full((len(uniques), len(columns)), np.nan)
+  a[codes_base] = base[columns].to_numpy(dtype=float)
+  b[codes_other] = other[columns].to_numpy(dtype=float)
+
+  diff = b - a
+  with np.errstate(divide='ignore', invalid='ignore'):
+    rel = diff / np.abs(a)
+  # A cell breaks when it differs beyond both tolerances, or is only present on one side
+  breaks = (np.abs(diff) > tolerance) & ~(np.abs(rel) <= rel_tolerance)
+  breaks |= np.isnan(a) != np.isnan(b)
+
+  rows, cols = np.nonzero(breaks)
+  report = pd.DataFrame({k: values[k][first[rows]] for k in keys})
+  report['column'] = np.asarray(columns, dtype=object)[cols]
+  report['base'] = a[rows, cols]
+  report['other'] = b[rows, cols]
+  report['diff'] = diff[rows, cols]
+  report['rel_diff'] = rel[rows, cols]
+  return report
+
+# Bytes of values that percentiles and CTEs are computed from by default in summarize_runs, across all its workers
+SUMMARY_MEMORY = 256 * 2 ** 20
+
+class _RunStats:
+  '''Running statistics of output values across runs, one value per cell (key and column) per run
+
+  Means and variances are updated one run at a time (Welford) and partial results combine exactly (Chan et al.),
+  so runs can be reduced in any order and on any number of workers. Percentiles and CTEs come from the values
+  kept: a reservoir sample of as many runs as fit in memory bytes (8 bytes per cell and column of a run) when memory
+  is given, otherwise of sample runs, or every run's when sample is None too.
+  '''
+  def __init__(self, keys, columns, sample=None, seed=None, memory=None):
+    self.keys, self.columns = list(keys), list(columns)
+    self.sample = sample
+    self.memory = memory
+    self.rng = np.random.default_rng(seed)
+    self.index = None
+    self.runs = 0
+    self.values = []
+
+  def _align(self, index):
+    # Grow the statistics to cover cells not seen before
+    if self.index is None:
+      shape = (len(index), len(self.columns))
+      self.index = index
+      self.n = np.zeros(shape)
+      self.mean, self.m2 = np.zeros(shape), np.zeros(shape)
+      self.min, self.max = np.full(shape, np.nan), np.full(shape, np.nan)
+      return
+    union = self.index.union(index, sort=False)
+    if len(union) == len(self.index):
+      return
+    pos = union.get_indexer(self.index)
+    for attr, fill in (('n', 0.0), ('mean', 0.0), ('m2', 0.0), ('min', np.nan), ('max', np.nan)):
+      grown = np.full((len(union), len(self.columns)), fill)
+      grown[pos] = getattr(self, attr)
+      setattr(self, attr, grown)
+    for i, v in enumerate(self.values):
+      grown = np.full((len(union), len(self.columns)), np.nan)
+      grown[pos] = v
+      self.values[i] = grown
+    self.index = union
+
+  def _capacity(self):
+    # Most runs to keep the values of, None for every run
+    if self.memory is None:
+      return self.sample
+    return max(1, int(self.memory // (8 * len(self.index) * max(len(self.columns), 1))))
+
+  def _trim(self, k):
+    # A random subset of a uniform sample is a uniform sample, so the reservoir can shrink as cells are added
+    if k is not None and len(self.values) > k:
+      keep = self.rng.choice(len(self.values), k, replace=False)
+      self.values = [self.values[i] for i in keep]
+
+  def update(self, df):
+    '''Add the output of one run'''
+    df = df.set_index(self.keys)[self.columns]
+    if not df.index.is_unique:
+      raise ValueError('Keys %s do not identify the rows of the output uniquely'%self.keys)
+    self._align(df.index)
+    x = np.full(self.mean.shape, np.nan)
+    x[self.index.get_indexer(df.index)] = df.to_numpy(dtype=float)
+
+    seen = ~np.isnan(x)
+    self.n += seen
+    delta = np.where(seen, x - self.mean, 0.0)
+    self.mean += np.divide(delta, self.n, out=np.zeros_like(delta), where=self.n > 0)
+    self.m2 += np.where(seen, delta * (x - self.mean), 0.0)
+    self.min = np.fmin(self.min, x)
+    self.max = np.fmax(self.max, x)
+
+    self.runs += 1
+    k = self._capacity()
+    self._trim(k)
+    if k is None or len(self.values) < k:
+      self.values.append(x)
+    else:
+      # Reservoir sampling of whole runs
+      j = self.rng.integers(0, self.runs)
+      if j < k:
+        self.values[j] = x
+    return self
+
+  def merge(self, other):
+    '''Combine with the statistics of another set of runs'''
+    if other.index is None:
+      return self
+    if self.index is None:
+      other.values = list(other.values)
+      return other
+    self._align(other.index)
+    other._align(self.index)
+    at = other.index.get_indexer(self.index)
+    n_b, mean_b, m2_b = other.n[at], other.mean[at], other.m2[at]
+    n = self.n + n_b
+    delta = mean_b - self.mean
+    with np.errstate(divide='ignore', invalid='ignore'):
+      self.mean = np.where(n > 0, self.mean + delta * n_b / n, 0.0)
+      self.m2 = np.where(n > 0, self.m2 + m2_b + delta ** 2 * self.n * n_b / n, 0.0)
+    self.n = n
+    self.min = np.fmin(self.min, other.min[at])
+    self.max = np.fmax(self.max, other.max[at])
+
+    values_b = [v[at] for v in other.values]
+    cap = self._capacity()
+    if cap is None:
+      self.values += values_b
+    else:
+      # Draw the merged reservoir from each side in proportion to the runs it has seen
+      k = min(cap, len(self.values) + len(values_b))
+      from_a = min(self.rng.hypergeometric(self.runs, other.runs, k), len(self.values))
+      from_a = max(from_a, k - len(values_b))
+      a = self.rng.choice(len(self.values), from_a, replace=False)
+      b = self.rng.choice(len(values_b), k - from_a, replace=False)
+      self.values = [self.values[i] for i in a] + [values_b[i] for i in b]
+    self.runs += other.runs
+    return self
+
+  def result(self, percentiles=(), cte=()):
+    '''DataFrame of the statistics, indexed by the keys, with a (column, statistic) column index'''
+    stats = {'count': self.n, 'mean': np.where(self.n > 0, self.mean, np.nan)}
+    with np.errstate(divide='ignore', invalid='ignore'):
+      stats['std'] = np.sqrt(np.where(self.n > 1, self.m2 / (self.n - 1), np.nan))
+    stats['min'], stats['max'] = self.min, self.max
+    if (len(percentiles) or len(cte)) and self.values:
+      values = np.stack(self.values)
+      for p in percentiles:
+        stats['p%g'%(p * 100)] = np.nanquantile(values, p, axis=0)
+      for level in cte:
+        # Conditional tail expectation: mean of the values at or above the level's quantile
+        q = np.nanquantile(values, level, axis=0)
+        stats['cte%g'%(level * 100)] = np.nanmean(np.where(values >= q, values, np.nan), axis=0)
+    frame = pd.DataFrame(
+      np.stack([stats[k] for k in stats], axis=2).reshape(len(self.index), -1)
+      ,index=self.index
+      ,columns=pd.MultiIndex.from_product([self.columns, list(stats)])
+    )
+    return frame.sort_index()
+
+def _summarize_runs(paths, keys, columns, sample, seed, memory=None):
+  '''Reduce the output files of some runs into _RunStats, one run at a time'''
+  stats = None
+  for path in paths:
+    df = _read_output(path)
+    if stats is None:
+      keys, columns = _default_columns(df, keys, columns)
+      stats = _RunStats(keys, columns, sample, seed, memory)
+    stats.update(df)
+  return stats
+
+def _manifest(d):
+  '''DataFrame of the files written by a build, recorded with instrumentation'''
+  df = pd.DataFrame(d)
+  written = df.loc[df['written']] if 'written' in df else df
+  instrumentation.record(rows=written['rows'].sum(), bytes_written=written['bytes'].sum(), files=len(written))
+  return df
+
+# How float columns are written. Whole numbers come out without a decimal point, as integers do, so a column read as
+# integers in one chunk and as floats (because of a blank) in another is written the same way.
+FLOAT_FORMAT = '%.15g'
+
+def _write_segment(outfile, df):
+  '''Write a single AIA file and return its size in bytes'''
+  df.to_csv(outfile, sep = '\t', index = False, header=False, float_format=FLOAT_FORMAT)
+  return os.path.getsize(outfile)
+
+class Inventory:
+  '''Listing of the files of a model, taken with a single scan of its directory
+
+  The listing is only taken again when the directory's mtime changes, which happens whenever a file is added,
+  removed or renamed within it.
+
+  Attributes:
+    runs (dict): Run id to the file name of its metadata XML
+    logs (dict): Run id to a dict of log name to log file name
+    reports (dict): Run id to a list of its report file names
+    tables (list): Table files (\*.atb2x)
+    assets (list): Asset input files (\*.aia2)
+    liabilities (list): Liability input files (\*.ail2)
+  '''
+  # Changes made within this many seconds of a scan may not have moved the directory mtime yet
+  # (e.g. on shares with coarse timestamps), so scans that recent are not trusted
+  racy = 2.0
+
+  def __init__(self, directory, name):
+    self.directory = directory
+    self.name = name
+    self.mtime = None
+    self.scanned = None
+    self.runs, self.logs, self.reports = {}, {}, {}
+    self.tables, self.assets, self.liabilities = [], [], []
+
+  def stale(self):
+    '''Whether the directory may have changed since it was scanned'''
+    if self.mtime is None:
+      return True
+    mtime = os.stat(self.directory or '.').st_mtime_ns
+    return mtime != self.mtime or self.scanned - mtime / 1e9 < self.racy
+
+  def scan(self):
+    '''List the directory again'''
+    self.mtime = os.stat(self.directory or '.').st_mtime_ns
+    self.scanned = time.time()
+    runs, logs, reports = {}, {}, {}
+    tables, assets, liabilities = [], [], []
+    run_prefix = self.name + '.Run.'
+    proj_prefix = self.name + '.Proj.'
+    with os.scandir(self.directory or '.') as entries:
+      for entry in entries:
+        instrumentation.record(files=1)
+        if entry.is_dir():
+          continue
+        f = entry.name
+        ext = f.split('.')[-1].lower()
+        if f.startswith(run_prefix):
+          m = re.match(r'Run\.(\d+)\.(.+)$', f[len(self.name) + 1:])
+          if not m:
+            continue
+          if m[2].startswith('Meta'):
+            runs[m[1]] = f
+          elif ext == 'log':
+            logs.setdefault(m[1], {})[m[2][:-4].lower()] = f
+        elif f.startswith(proj_prefix):
+          m = re.match(r'Proj\.(\d+)\.Run\.\d+\.Rreq\.', f[len(self.name) + 1:])
+          if m:
+            reports.setdefault(m[1], []).append(f)
+        elif ext == 'atb2x':
+          tables.append(f)
+        elif ext == 'aia2':
+          assets.append(f)
+        elif ext == 'ail2':
+          liabilities.append(f)
+    
+    self.runs = dict(sorted(runs.items(), key=lambda kv: int(kv[0])))
+    self.logs, self.reports = logs, reports
+    self.tables, self.assets, self.liabilities = sorted(tables), sorted(assets), sorted(liabilities)
+    return self
+
+  def path(self, filename):
+    '''Full path to a file of the listing'''
+    return os.path.join(self.directory, filename)
+
+  def to_dict(self):
+    return {k: getattr(self, k) for k in ('directory', 'name', 'mtime', 'scanned', 'runs', 'logs', 'reports', 'tables', 'assets', 'liabilities')}
+
+  @classmethod
+  def from_dict(cls, d):
+    inv = cls(d['directory'], d['name'])
+    for k, v in d.items():
+      setattr(inv, k, v)
+    return inv
+
+  def save(self, path):
+    '''Keep the listing in a file, for other processes to use'''
+    try:
+      os.makedirs(os.path.dirname(path), exist_ok=True)
+      with open(path, 'w') as f:
+        json.dump(self.to_dict(), f)
+    except OSError:
+      pass
+
+  @classmethod
+  def load(cls, path, directory, name):
+    '''Listing kept in a file by save, or an empty one when there is none'''
+    try:
+      with open(path, 'r') as f:
+        inv = cls.from_dict(json.load(f))
+    except (OSError, ValueError, KeyError):
+      return cls(directory, name)
+    # The listing belongs to wherever the model is now
+    inv.directory = directory
+    return inv if inv.name == name else cls(directory, name)
+
+def _parse_metadata(path):
+  '''Read a run's Metadata XML into a dict
+
+  Items with only a Type are stored as text, and items that also have a Key are collected in a dict per Type.
+  '''
+  instrumentation.record(bytes_read=os.path.getsize(path), files=1)
+  d = dict()
+  for event, child in ET.iterparse(path, events=('end',)):
+    if 'Type' not in child.attrib:
+      continue
+    if len(child.attrib)==1:
+      # Easiest case
+      d[child.attrib['Type']] = child.text
+    else:
+      # First encounter of attribute creates its dict
+      d.setdefault(child.attrib['Type'], dict())[child.attrib['Key']] = child.text
+    child.clear()
+  return d
+
+class MetadataIndex:
+  '''Metadata of every run of a model, kept in SQLite so XMLs are only parsed when new or changed
+
+  The index lives in the model's .pyalfa folder. When that cannot be written to, it is kept in memory instead.
+  '''
+  def __init__(self, path):
+    try:
+      os.makedirs(os.path.dirname(path), exist_ok=True)
+      self.con = sqlite3.connect(path, check_same_thread=False)
+      self._create()
+    except (OSError, sqlite3.Error):
+      self.con = sqlite3.connect(':memory:', check_same_thread=False)
+      self._create()
+
+  def _create(self):
+    with self.con:
+      self.con.execute('CREATE TABLE IF NOT EXISTS files (run TEXT PRIMARY KEY, size INTEGER, mtime INTEGER)')
+      self.con.execute('CREATE TABLE IF NOT EXISTS metadata (run TEXT, type TEXT, key TEXT, value TEXT)')
+      self.con.execute('CREATE INDEX IF NOT EXISTS metadata_run ON metadata (run)')
+
+  def update(self, inventory):
+    '''Parse the XMLs of runs that are new or changed since the last update, and forget runs that are gone
+
+    A run whose XML cannot be parsed (e.g. one ALFA is still writing) is left out, and tried again on the next update.
+
+    Returns:
+      Tuple of the list of runs that were parsed, and a dict of run id to the error raised for each run that failed
+    '''
+    known = {r: (size, mtime) for r, size, mtime in self.con.execute('SELECT run, size, mtime FROM files')}
+    current = {}
+    for r, f in inventory.runs.items():
+      if f.endswith('.Metadata.xml'):
+        st = os.stat(inventory.path(f))
+        current[r] = (st.st_size, st.st_mtime_ns)
+
+    changed = [r for r in current if known.get(r) != current[r]]
+    gone = [r for r in known if r not in current]
+    parsed, errors = {}, {}
+    for r in changed:
+      try:
+        parsed[r] = _parse_metadata(inventory.path(inventory.runs[r]))
+      except (ET.ParseError, OSError) as e:
+        errors[r] = e
+    with self.con:
+      for r in changed + gone:
+        self.con.execute('DELETE FROM metadata WHERE run = ?', (r,))
+        self.con.execute('DELETE FROM files WHERE run = ?', (r,))
+      for r, d in parsed.items():
+        rows = []
+        for t, v in d.items():
+          if isinstance(v, dict):
+            rows.extend((r, t, k, kv) for k, kv in v.items())
+          else:
+            rows.append((r, t, None, v))
+        self.con.executemany('INSERT INTO metadata VALUES (?, ?, ?, ?)', rows)
+        self.con.execute('INSERT INTO files VALUES (?, ?, ?)', (r,) + current[r])
+    return list(parsed), errors
+
+  def metadata(self, run):
+    '''Metadata of one run, in the layout of its XML (Items with a Key collected in a dict per Type)'''
+    d = dict()
+    for t, k, v in self.con.execute('SELECT type, key, value FROM metadata WHERE run = ?', (run,)):
+      if k is None:
+        d[t] = v
+      else:
+        d.setdefault(t, dict())[k] = v
+    return d
+
+  def frame(self):
+    '''DataFrame of every run's metadata, one row per run
+
+    Items with a Key become columns named Type.Key
+    '''
+    df = pd.DataFrame(self.con.execute('SELECT run, type, key, value FROM metadata').fetchall(), columns=['run', 'type', 'key', 'value'])
+    df['column'] = df['type'].where(df['key'].isna(), df['type'] + '.' + df['key'])
+    wide = df.pivot(index='run', columns='column', values='value')
+    wide.columns.name = None
+    return wide.iloc[np.argsort(wide.index.astype(int), kind='stable')]
+
+class RunStore:
+  '''Output of many runs, consolidated into one memory mapped store with a file per column
+
+  Rows are kept in run order, so each run's rows are one range of every column. Numeric columns are stored as raw
+  arrays and other columns as codes into their categories. Files are memory mapped read only: any number of processes
+  can open the store without copying it and share its pages, and reading some columns or runs only touches their pages.
+
+  Build one with Model.consolidate. Each build is kept as a version in a folder of its own, and the store folder
+  points to the current one, so a store stays readable while a newer version is published.
+
+  Attributes:
+    path (str): Folder of the version of the store read
+    runs (list): Ids of the runs in the store, in the order they are stored
+    columns (list): Output columns
+    errors (dict): Run id to the error that kept its output out of the store
+  '''
+  meta_name = 'store.json'
+  pointer_name = 'CURRENT'
+
+  def __init__(self, path):
+    pointer = os.path.join(path, self.pointer_name)
+    if os.path.exists(pointer):
+      with open(pointer, 'r') as f:
+        path = os.path.join(path, f.read().strip())
+    self.path = path
+    with open(os.path.join(path, self.meta_name), 'r') as f:
+      self.meta = json.load(f)
+    self.runs = self.meta['runs']
+    self.columns = [spec['name'] for spec in self.meta['columns']]
+    self.errors = self.meta['errors']
+    self.offsets = np.asarray(self.meta['offsets'], dtype=np.int64)
+    self.__specs = {spec['name']: spec for spec in self.meta['columns']}
+    self.__positions = {r: i for i, r in enumerate(self.runs)}
+    self.__arrays = {}
+
+  def __len__(self):
+    return int(self.offsets[-1])
+
+  def _spec(self, column):
+    if column not in self.__specs:
+      raise KeyError('No column "%s" in the store. Its columns are: %s'%(column, ', '.join(self.columns)))
+    return self.__specs[column]
+
+  def _array(self, column):
+    # Values (or category codes) of a column, memory mapped on first use
+    if column not in self.__arrays:
+      spec = self._spec(column)
+      if len(self):
+        self.__arrays[column] = np.memmap(os.path.join(self.path, spec['file']), dtype=spec['dtype'], mode='r', shape=(len(self),))
+      else:
+        self.__arrays[column] = np.empty(0, dtype=spec['dtype'])
+    return self.__arrays[column]
+
+  def rows(self, run):
+    '''Range of rows of a run, as a slice'''
+    i = self.__positions.get(str(run))
+    if i is None:
+      raise ValueError('Run %s is not in the store'%run)
+    return slice(int(self.offsets[i]), int(self.offsets[i + 1]))
+
+  def column(self, column, run=None):
+    '''Values of a column for every run, or for one run. Category columns are returned as a Categorical.'''
+    values = self._array(column)
+    if run is not None:
+      values = values[self.rows(run)]
+    spec = self._spec(column)
+    return pd.Categorical.from_codes(values, spec['categories']) if 'categories' in spec else values
+
+  def load(self, runs=None, columns=None, where=None):
+    '''Output of some or all runs as one DataFrame with a 'run' column, as Model.load_runs returns
+
+    Args:
+      runs (optional list): Runs to read. Default is every run in the store.
+      columns (optional list): Columns to read. Default is every column.
+      where (optional dict): Column to a value, or a list of values, that rows must have (e.g. {'Line': 'Reserve'})
+
+    Returns:
+      DataFrame, with category columns for the run and for the columns stored as categories
+    '''
+    ids = self.runs if runs is None else [str(r) for r in runs]
+    ranges = [self.rows(r) for r in ids]
+    if runs is None:
+      rows = slice(0, len(self))
+    else:
+      rows = np.concatenate([np.arange(rng.start, rng.stop) for rng in ranges] + [np.empty(0, dtype=np.int64)])
+    run_codes = np.repeat(np.arange(len(ids)), [rng.stop - rng.start for rng in ranges])
+
+    # Filters only read the columns they are on
+    for c, v in (where or {}).items():
+      spec = self._spec(c)
+      values = list(v) if isinstance(v, (list, tuple, set)) else [v]
+      if 'categories' in spec:
+        lookup = {x: i for i, x in enumerate(spec['categories'])}
+        values = [lookup[x] for x in values if x in lookup]
+      keep = np.flatnonzero(np.isin(self._array(c)[rows], values))
+      rows = keep + rows.start if isinstance(rows, slice) else rows[keep]
+      run_codes = run_codes[keep]
+
+    data = {'run': pd.Categorical.from_codes(run_codes, ids)}
+    for c in (self.columns if columns is None else columns):
+      spec = self._spec(c)
+      values = self._array(c)[rows]
+      data[c] = pd.Categorical.from_codes(values, spec['categories']) if 'categories' in spec else np.asarray(values)
+    return pd.DataFrame(data)
+
+def _publish_store(path, version):
+  '''Point a store folder at a new version, then remove versions that are no longer needed
+
+  The pointer is switched with one rename. The version it replaces is kept for readers that have just looked it up,
+  and any other version that cannot be removed yet (e.g. still memory mapped on Windows) is tried again next time.
+  '''
+  pointer = os.path.join(path, RunStore.pointer_name)
+  try:
+    with open(pointer, 'r') as f:
+      previous = f.read().strip()
+  except OSError:
+    previous = None
+  fd, tmp = tempfile.mkstemp(dir=path)
+  with os.fdopen(fd, 'w') as f:
+    f.write(version)
+  for attempt in range(5):
+    try:
+      os.replace(tmp, pointer)
+      break
+    except PermissionError:
+      # The pointer is being read by another process
+      if attempt == 4:
+        raise
+      time.sleep(0.1)
+
+  # Versions are named after the time their build started
+  started = lambda name: int(name.split('-')[0]) if name.split('-')[0].isdigit() else 0
+  for name in os.listdir(path):
+    folder = os.path.join(path, name)
+    if name in (version, previous) or not os.path.isdir(folder):
+      continue
+    if os.path.exists(os.path.join(folder, RunStore.meta_name)):
+      # Only versions older than this one, rather than a newer one about to be published
+      stale = started(name) < started(version)
+    else:
+      # Still being built, unless it was left by a build that failed a day ago
+      stale = time.time() - os.stat(folder).st_mtime > 86400
+    if stale:
+      shutil.rmtree(folder, ignore_errors=True)
+
+def _store_columns(df):
+  '''How the columns of a run's output are stored: numeric columns as they are, others as category codes'''
+  specs = []
+  for i, c in enumerate(df.columns):
+    spec = {'name': c, 'file': 'c%03d.bin'%i}
+    if pd.api.types.is_numeric_dtype(df[c]) and not isinstance(df[c].dtype, pd.CategoricalDtype):
+      spec['dtype'] = df[c].dtype.str
+    else:
+      spec['dtype'] = '<i4'
+      spec['categories'] = []
+    specs.append(spec)
+  return specs
+
+def _store_values(df, specs, lookups):
+  '''Arrays of a run's output to append to the store, with new categories added to lookups and the specs'''
+  if list(df.columns) != [spec['name'] for spec in specs]:
+    raise ValueError('Output has columns %s rather than the %s of the other runs'%(list(df.columns), [spec['name'] for spec in specs]))
+  arrays = []
+  added = []
+  for spec in specs:
+    s = df[spec['name']]
+    if 'categories' in spec:
+      codes, uniques = pd.factorize(s)
+      lookup = lookups.setdefault(spec['name'], {})
+      mapped = np.empty(len(uniques) + 1, dtype=np.int32)
+      mapped[-1] = -1
+      for i, u in enumerate(uniques):
+        if u not in lookup:
+          lookup[u] = len(lookup)
+          added.append((spec, u))
+        mapped[i] = lookup[u]
+      arrays.append(mapped[codes])
+    else:
+      values = s.to_numpy()
+      if not np.can_cast(values.dtype, spec['dtype'], 'same_kind'):
+        raise ValueError('Column %s is %s rather than the %s of the other runs'%(spec['name'], values.dtype, np.dtype(spec['dtype'])))
+      arrays.append(values.astype(spec['dtype'], copy=False))
+  # Only a run that is stored adds its categories
+  for spec, u in added:
+    spec['categories'].append(u)
+  return arrays
+
+class _Inotify:
+  '''Changes to the entries of a directory, from Linux inotify through ctypes
+
+  Raises OSError when inotify is not available, as on any other system than Linux.
+  '''
+  # IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_CLOSE_WRITE
+  mask = 0x40 | 0x80 | 0x100 | 0x200 | 0x8
+
+  def __init__(self, directory):
+    if not sys.platform.startswith('linux'):
+      # Elsewhere there is no inotify, and on Windows looking up libc does not even fail with OSError
+      raise OSError('inotify is only available on Linux')
+    import ctypes, ctypes.util
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    if self.fd < 0:
+      raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+    if libc.inotify_add_watch(self.fd, os.fsencode(directory or '.'), self.mask) < 0:
+      err = ctypes.get_errno()
+      os.close(self.fd)
+      raise OSError(err, 'inotify_add_watch failed for "%s"'%directory)
+
+  def drain(self):
+    '''Discard the pending notifications'''
+    try:
+      while os.read(self.fd, 65536):
+        pass
+    except BlockingIOError:
+      pass
+
+  def close(self):
+    os.close(self.fd)
+
+class RunWatcher:
+  '''Watch a model directory for runs as ALFA finishes them
+
+  A run is completed once its Metadata XML is in the directory (or has changed, for a run done again) and the model
+  is not locked. Only the completed run's metadata is parsed, into the model's metadata index, and its output is read
+  into the binary cache, so later reads of it are fast.
+
+  On Linux the directory is watched with inotify, so runs are picked up as soon as files change. The directory is
+  also checked every interval seconds, for other systems and for network shares, which inotify does not see changes to.
+
+  Each event is a dict with
+    event: 'completed' or 'removed'
+    id: Id of the run
+    run: Run instance, with its output loaded when output is True (None when removed)
+    error: Exception raised reading the run's output, if any
+
+  Examples:
+    Update a dashboard as runs complete::
+
+      async def ingest(m):
+        async for e in m.watch():
+          if e['event'] == 'completed' and e['error'] is None:
+            dashboard.update(e['id'], e['run'].output)
+
+      asyncio.get_event_loop().run_until_complete(ingest(m))
+  '''
+  def __init__(self, model, interval=1.0, existing=False, output=True, inotify=True):
+    '''
+    Args:
+      model: Model to watch
+      interval (optional float): Most seconds between checks of the directory
+      existing (optional bool): Default is False. Emit the runs already in the directory as completed, on the first check.
+      output (optional bool): Default is True. Read the output of completed runs.
+      inotify (optional bool): Default is True. Use inotify when available, otherwise only check every interval.
+    '''
+    self.model = model
+    self.interval = interval
+    self.output = output
+    self.inotify = inotify
+    self.__seen = {} if existing else self._current()
+
+  def _current(self):
+    # Size and modification time of the metadata file of each run
+    inv = self.model.inventory
+    current = {}
+    for r, f in inv.runs.items():
+      try:
+        st = os.stat(inv.path(f))
+      except OSError:
+        continue
+      current[r] = (st.st_size, st.st_mtime_ns)
+    return current
+
+  def check(self):
+    '''Look for runs completed or removed since the last check
+
+    Nothing is reported while the model is locked, as ALFA may still be writing the run.
+
+    Returns:
+      List of events
+    '''
+    if self.model.locked:
+      return []
+    current = self._current()
+    completed = [r for r in current if self.__seen.get(r) != current[r]]
+    removed = [r for r in self.__seen if r not in current]
+    events = [{'event': 'removed', 'id': r, 'run': None, 'error': None} for r in removed]
+    if not completed:
+      self.__seen = current
+      return events
+
+    index = self.model._get_metadata_index()
+    parsed, errors = index.update(self.model.inventory)
+    # Runs whose XML is still being written are held back and picked up on a later check, the others are reported
+    seen = self.__seen
+    self.__seen = {r: seen[r] if r in errors else v for r, v in current.items() if r not in errors or r in seen}
+    for r in completed:
+      if r in errors:
+        continue
+      run = self.model._make_run(index.metadata(r))
+      error = None
+      if self.output:
+        try:
+          run.load_output()
+        except Exception as e:
+          error = e
+      events.append({'event': 'completed', 'id': r, 'run': run, 'error': error})
+    return events
+
+  def _open_inotify(self):
+    if self.inotify:
+      try:
+        return _Inotify(self.model.dir)
+      except (OSError, AttributeError):
+        pass
+    return None
+
+  async def events(self):
+    '''Yield events as runs complete, without blocking the event loop'''
+    loop = asyncio.get_event_loop()
+    changed = asyncio.Event()
+    notify = self._open_inotify()
+    if notify is not None:
+      def readable():
+        notify.drain()
+        changed.set()
+      try:
+        loop.add_reader(notify.fd, readable)
+      except NotImplementedError:
+        # Event loops without add_reader (e.g. Proactor) only check every interval
+        notify.close()
+        notify = None
+    try:
+      while True:
+        for e in await loop.run_in_executor(None, self.check):
+          yield e
+        try:
+          await asyncio.wait_for(changed.wait(), self.interval)
+        except asyncio.TimeoutError:
+          pass
+        changed.clear()
+    finally:
+      if notify is not None:
+        loop.remove_reader(notify.fd)
+        notify.close()
+
+  def __aiter__(self):
+    return self.events()
+
+def _combine_runs(ids, frames, concat):
+  '''Output of many runs in the order they were asked for, as a dict or as one DataFrame with a 'run' column'''
+  frames = {r: frames[r] for r in ids if r in frames}
+  if not concat:
+    return frames
+  if not frames:
+    return pd.DataFrame()
+  df = pd.concat([f.assign(run=r) for r, f in frames.items()], ignore_index=True)
+  df['run'] = df['run'].astype('category')
+  return df[['run'] + [c for c in df.columns if c != 'run']]
+
+# Most blocking file operations at once, for each call of an async method not given a limit
+ASYNC_LIMIT = 8
+
+def _semaphore(limit):
+  return limit if isinstance(limit, asyncio.Semaphore) else asyncio.Semaphore(limit or ASYNC_LIMIT)
+
+async def _blocking(semaphore, fn, *args):
+  '''Call fn in the event loop's default executor, once the semaphore allows'''
+  async with semaphore:
+    return await asyncio.get_event_loop().run_in_executor(None, functools.partial(fn, *args))
+
+def _intern_metadata(d):
+  '''Metadata with its strings interned, so runs with the same values share one copy of them'''
+  return {
+    sys.intern(k): _intern_metadata(v) if isinstance(v, dict) else sys.intern(v) if isinstance(v, str) else v
+    for k, v in d.items()
+  }
+
+def _match_runs(df, criteria):
+  '''Mask of the runs whose metadata matches every criterion, see Model.query_runs'''
+  mask = np.ones(len(df), dtype=bool)
+  for col, v in criteria.items():
+    if col not in df.columns:
+      raise KeyError('"%s" is not in the metadata of any run'%col)
+    s = df[col]
+    if callable(v):
+      mask &= np.asarray(v(s), dtype=bool)
+    elif isinstance(v, type(re.compile(''))):
+      mask &= s.astype(object).str.contains(v, na=False).to_numpy(dtype=bool)
+    elif isinstance(v, (list, tuple, set)):
+      mask &= s.isin(v).to_numpy()
+    else:
+      mask &= (s == v).to_numpy(dtype=bool)
+  return mask
+
+class RunSet(Mapping):
+  '''Runs of a model with their metadata held column-wise, as a mapping of run id to Run
+
+  Metadata is kept in one DataFrame, indexed by run number, with a category column per item, so holding thousands of
+  runs takes kilobytes. Runs are only made when asked for. They share the model and let go of their output when it is
+  no longer used elsewhere.
+
+  Attributes:
+    model: The Model the runs belong to
+    metadata: DataFrame of the metadata of the runs
+
+  Examples:
+    Read the output of the runs of one scenario, one at a time::
+
+      for run in m.run_set().query(where={'Scenario.Rates': 'Up'}).values():
+        run.output
+  '''
+  def __init__(self, model, metadata):
+    self.model = model
+    # Run ids stay as listed (e.g. '007'), so runs are found and read under the same ids as Model.run
+    metadata = metadata.astype('category')
+    metadata.index = pd.Index(metadata.index.astype(str), name='run')
+    self.metadata = metadata
+
+  def __getitem__(self, r):
+    try:
+      row = self.metadata.loc[str(r)]
+    except KeyError:
+      raise KeyError('Run %s is not in the set'%r)
+    d = {'ProjectionId': str(r)}
+    for col, v in row.items():
+      if isinstance(v, str):
+        if '.' in col:
+          t, k = col.split('.', 1)
+          d.setdefault(t, {})[k] = v
+        else:
+          d[col] = v
+    return Run(self.model, d, weak=True)
+
+  def __contains__(self, r):
+    return str(r) in self.metadata.index
+
+  def __iter__(self):
+    return iter(self.metadata.index)
+
+  def __len__(self):
+    return len(self.metadata)
+
+  def query(self, where=None, **criteria):
+    '''Runs whose metadata matches, as a RunSet. Criteria are as for Model.query_runs.'''
+    return RunSet(self.model, self.metadata.loc[_match_runs(self.metadata, dict(where or {}, **criteria))])
+
+  def load(self, **kwargs):
+    '''Read the output of the runs, see Model.load_runs'''
+    return self.model.load_runs(list(self), **kwargs)
+
+def _pick_output(reports, name, r, directory):
+  '''File to read a run's output from. When there are several reports, prefer the ones ALFA projections usually
+  produce, otherwise see Run.reports'''
+  key = _output_key(reports)
+  if key:
+    return reports.file(key)
+  elif len(reports):
+    raise ValueError("%s.Proj.%s has several reports (%s). Use the reports attribute to pick one."%(name, r, ', '.join(reports)))
+  else:
+    raise FileNotFoundError("Could not find output for %s.Proj.%s in '%s' ... Its possible that I am not yet equipped to read in the output your looking for."%(name, r, directory))
 
 class Model:
   '''General class for an MG-ALFA model
@@ -20,7 +1436,7 @@ class Model:
       m.runs
 
   '''
-  def __init__(self, full_path_to_model_file, valdate = None):
+  def __init__(self, full_path_to_model_file, valdate = None, persist_inventory = False):
     # ensure the provided path exists
     if os.path.exists(full_path_to_model_file):
       # See if a file or directory was provided.
@@ -44,17 +1460,51 @@ class Model:
     else:
       raise FileNotFoundError("Could not initialize model at '%s'\nMake sure you entered the path correctly and that it can be accessed by you."%full_path_to_model_file)
     
-    self.__excluded = []
+    self.__excluded = set()
+    self.__persist_inventory = persist_inventory
+    self.__inventory = None
+    self.__metadata_index = None
+    self.__tables = None
     # Give the model a valuation date, even though it won't really be useful in practice
   
+  def _get_inventory(self):
+    # Only list the directory again when it has changed
+    inv = self.__inventory
+    if inv is None or inv.name != self.name:
+      inv = Inventory.load(self._inventory_file(), self.dir, self.name) if self.__persist_inventory else Inventory(self.dir, self.name)
+    if inv.stale():
+      inv.scan()
+      if self.__persist_inventory:
+        inv.save(self._inventory_file())
+    self.__inventory = inv
+    return inv
+
+  def _inventory_file(self):
+    return os.path.join(self.dir, CACHE_DIR, '%s.inventory.json'%self.name)
+
+  def refresh(self):
+    '''List the files of the model again, whether or not the directory looks changed
+
+    Returns:
+      The model's Inventory
+    '''
+    self._get_inventory()
+    self.__inventory.scan()
+    if self.__persist_inventory:
+      self.__inventory.save(self._inventory_file())
+    return self.__inventory
+
   def _get_tableFiles(self):
     '''Return a list of tables files used by the model'''
-    l = []
-    for filename in os.listdir(self.dir):
-      if filename.split('.')[-1].lower()=='atb2x':
-        l.append(filename)
-    
-    return l
+    return list(self.inventory.tables)
+
+  def _get_tableData(self):
+    # Kept while the table files are the same, so tables already read are not read again
+    inv = self.inventory
+    files = [inv.path(f) for f in inv.tables]
+    if self.__tables is None or sorted(self.__tables.file(name) for name in self.__tables) != sorted(files):
+      self.__tables = Tables(files)
+    return self.__tables
   
   def _get_modelName(self):
     # Get list of .ain2 files in model directory
@@ -69,27 +1519,50 @@ class Model:
   def _get_modelFile(self):
     return os.path.split(self.__model_file)[1]
   
+  @_instrumented('Model._get_runs')
   def _get_runs(self):
     # return list of runs in the model directory (for the model)
-    files = glob.glob(os.path.join(self.dir, '%s.Run.*.Meta*'% self.name))
-    return [re.search('Run\.(\d+)\.', f)[1] for f in files]
+    return list(self.inventory.runs)
   
   def exclude(self, v):
     '''Method to exclude specific assets from the model
 
+    Identifiers are kept as strings in a set, so 1234, 1234.0 and '1234' are the same asset and
+    checking a large list of them is cheap. Missing values are ignored.
+
+    Args:
+      v: An identifier, or a list/tuple/set/Series/array of identifiers
+
     Returns:
       None
     '''
     # See what was provided
-    if isinstance(v, (str, int)):
+    if isinstance(v, (str, numbers.Integral)):
       v = [v]
-    elif not isinstance(v,(list,tuple)):
+    elif not isinstance(v,(list,tuple,set,frozenset,np.ndarray,pd.Series,pd.Index)):
       raise ValueError ('Cannot provide an argument of type %s'%type(v))
     
     # Add provided value(s) to excluded assets
-    self.__excluded.extend(v)
+    v = pd.Series(list(v), dtype=object).dropna()
+    self.__excluded.update(_id_strings(v))
+
+  def exclude_file(self, path, column=None):
+    '''Exclude every asset listed in a file
+
+    Args:
+      path (str): Text file with one identifier per line, or a CSV file when column is given
+      column (optional str): Column of the CSV file holding the identifiers
 
+    Returns:
+      None
+    '''
+    if column is None:
+      with open(path, 'r') as f:
+        self.exclude([line.strip() for line in f if line.strip()])
+    else:
+      self.exclude(pd.read_csv(path, usecols=[column], dtype=str)[column].dropna())
 
+  @_instrumented('Model.run')
   def run(self, r):
     '''Get specific information for a run, as a run instance
     Args:
@@ -100,33 +1573,361 @@ class Model:
     '''
     # Ensure that r is a valid run
     # TODO: Provide some str-int leniency here
-    if r not in self.runs:
+    inv = self.inventory
+    if r not in inv.runs:
       raise ValueError('%s does not appear to be an available run. Check that its output is in "%s"'%(r, self.dir))
       return # Do we even need this
     
     # Read in the XML output from the run
-    if os.path.exists(os.path.join(self.dir, '%s.Run.%s.Metadata.xml' %(self.name, r))):
-      d = dict()
-      tree = ET.parse(os.path.join(self.dir, '%s.Run.%s.Metadata.xml' %(self.name, r)))
-      root = tree.getroot()
-      for child in root:
-        if len(child.attrib)==1:
-          # Easiest case
-          d[child.attrib['Type']] = child.text
-        else:
-          if not child.attrib['Type'] in d.keys():
-            # First encounter of attribute
-            d[child.attrib['Type']] = dict()
-          
-          d[child.attrib['Type']][child.attrib['Key']] = child.text
+    d = dict()
+    if inv.runs[r].endswith('.Metadata.xml'):
+      d = _parse_metadata(inv.path(inv.runs[r]))
     
     # Create instance of Run class using XML data
-    return Run(metadata=d, **(self.__dict__))  
+    return self._make_run(d)
+
+  def _make_run(self, metadata):
+    return Run(self, metadata)
+
+  def _listed_run(self, r):
+    inv = self.inventory
+    if r not in inv.runs:
+      raise ValueError('%s does not appear to be an available run. Check that its output is in "%s"'%(r, self.dir))
+    return inv
+
+  def _output_file(self, r):
+    # Path of the run's output, found from the listing alone so that reading many runs neither parses their
+    # metadata nor builds a Model per run
+    inv = self._listed_run(r)
+    return _pick_output(Reports([inv.path(f) for f in inv.reports.get(r, [])]), self.name, r, self.dir)
+
+  def _log_files(self, r):
+    # Log name to path of each log of the run, from the listing
+    inv = self._listed_run(r)
+    return {k: inv.path(f) for k, f in inv.logs.get(r, {}).items()}
+
+  def _get_metadata_index(self):
+    if self.__metadata_index is None:
+      self.__metadata_index = MetadataIndex(os.path.join(self.dir, CACHE_DIR, '%s.metadata.sqlite'%self.name))
+    return self.__metadata_index
+
+  def consolidate(self, ids=None, columns=None, dtype=None, workers=None, path=None, rebuild=False):
+    '''Consolidate the output of runs into a RunStore, which any number of processes can read quickly
+
+    The store is kept in the model's .pyalfa folder by default. It is only built again when runs are added or removed
+    or their output files change, so it is cheap to call before every use. A rebuild publishes a new version of the
+    store, so processes calling it at once do not get in each other's way, and stores already open stay readable.
+
+    Args:
+      ids (optional list): Runs to include. Default is every run of the model.
+      columns (optional list): Only keep these output columns
+      dtype (optional): dtype schema, as for Run.load_output (e.g. 'float32' halves the size of float columns)
+      workers (optional int): Number of runs to read at once
+      path (optional str): Folder to keep the store in
+      rebuild (optional bool): Default is False. Build the store even when it looks up to date.
+
+    Returns:
+      RunStore
+
+    Examples:
+      Read one line item of every run, touching only the pages of the columns involved::
+
+        store = m.consolidate()
+        store.load(columns=['Period', 'Value'], where={'Line': 'Reserve'})
+    '''
+    path = path or os.path.join(self.dir, CACHE_DIR, '%s.store'%self.name)
+    inv = self.inventory
+    ids = self.runs if ids is None else [str(r) for r in ids]
+    files, errors = {}, {}
+    for r in ids:
+      reports = {Reports.key(f): inv.path(f) for f in inv.reports.get(r, [])}
+      key = _output_key(reports)
+      if key:
+        files[r] = reports[key]
+      else:
+        errors[r] = 'No output found for run %s'%r
+    sources = {r: [f, os.path.getsize(f), os.stat(f).st_mtime_ns] for r, f in files.items()}
+    options = {'ids': ids, 'columns': columns, 'dtype': dtype}
+
+    if not rebuild:
+      try:
+        store = RunStore(path)
+        if store.meta['sources'] == sources and store.meta['options'] == options:
+          return store
+      except (OSError, ValueError, KeyError):
+        pass
+
+    def read(r):
+      try:
+        return _read_output(files[r], columns, dtype, False)
+      except Exception as e:
+        return e
+
+    # Build a new version in a folder of its own, so concurrent builds never share one and stores already open
+    # (memory mapped by other processes) are left alone
+    os.makedirs(path, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix='%d-'%int(time.time() * 1e9), dir=path)
+    specs, handles, lookups = None, [], {}
+    offsets, stored = [0], []
+    try:
+      with _get_executor(workers) as pool:
+        # A batch of runs is read at a time, so only a few runs' output is held at once
+        batch = max(workers or os.cpu_count() or 1, 1) * 2
+        readable = list(files)
+        for i in range(0, len(readable), batch):
+          for r, df in zip(readable[i:i + batch], pool.map(read, readable[i:i + batch])):
+            if isinstance(df, Exception):
+              errors[r] = str(df)
+              continue
+            if specs is None:
+              specs = _store_columns(df)
+              handles = [open(os.path.join(tmp, spec['file']), 'wb') for spec in specs]
+            try:
+              arrays = _store_values(df, specs, lookups)
+            except ValueError as e:
+              errors[r] = str(e)
+              continue
+            for f, a in zip(handles, arrays):
+              f.write(a.tobytes())
+            offsets.append(offsets[-1] + len(df))
+            stored.append(r)
+    finally:
+      for f in handles:
+        f.close()
+
+    meta = {
+      'runs': stored
+      ,'offsets': offsets
+      ,'columns': specs or []
+      ,'errors': {r: errors[r] for r in ids if r in errors}
+      ,'sources': sources
+      ,'options': options
+    }
+    with open(os.path.join(tmp, RunStore.meta_name), 'w') as f:
+      json.dump(meta, f, default=str)
+    _publish_store(path, os.path.basename(tmp))
+    return RunStore(path)
+
+  def watch(self, interval=1.0, existing=False, output=True):
+    '''Watch the model directory for runs as ALFA finishes them, see RunWatcher
+
+    Returns:
+      RunWatcher, to iterate over with async for, or to check() now and then
+    '''
+    return RunWatcher(self, interval, existing, output)
+
+  def runs_frame(self):
+    '''Metadata of every run of the model, as a DataFrame indexed by run id
+
+    Metadata is kept in an index in the model's .pyalfa folder, and only the XMLs of new or changed runs are parsed.
+    Items with a Key (e.g. <Item Type="Scenario" Key="Rates">) become columns named Type.Key. Runs whose XML cannot
+    be parsed (e.g. still being written) are left out until it can.
+    '''
+    index = self._get_metadata_index()
+    index.update(self.inventory)
+    return index.frame()
+
+  def query_runs(self, where=None, **criteria):
+    '''Find runs by their metadata
+
+    Each criterion matches a metadata column against a value, a list of values, a compiled regex (searched for)
+    or a callable taking the column and returning a boolean mask.
+
+    Args:
+      where (optional dict): Criteria by column name, for columns that are not valid keyword names (e.g. 'Scenario.Rates')
+      criteria: Criteria by column name
+
+    Returns:
+      DataFrame of the metadata of matching runs
+
+    Examples:
+      Runs at a valuation date with a sensitivity in their description::
+
+        m.query_runs(ValuationDate='08/31/2020', ProjectionDescription=re.compile('sens', re.I))
+    '''
+    df = self.runs_frame()
+    return df.loc[_match_runs(df, dict(where or {}, **criteria))]
+
+  def run_set(self, ids=None):
+    '''Runs of the model with their metadata held column-wise, see RunSet
+
+    Args:
+      ids (optional list): Runs to include. Default is every run of the model.
+    '''
+    df = self.runs_frame()
+    if ids is not None:
+      df = df.loc[[str(r) for r in ids]]
+    return RunSet(self, df)
+
+  def search_logs(self, pattern, runs=None, logs=None, workers=None, executor='process'):
+    '''Find lines matching a regex in the logs of many runs, in parallel
+
+    Args:
+      pattern: Regex, as a str or bytes
+      runs (optional list): Runs to search. Default is all runs.
+      logs (optional list): Names of the logs to search (e.g. ['debug']). Default is all of them.
+      workers (optional int): Number of runs to search at once
+      executor (optional str): 'process' (default), as regex matching holds the GIL, or 'thread'
+
+    Returns:
+      DataFrame with the run, log, line number, byte offset and text of each matching line
+    '''
+    runs = self.runs if runs is None else [str(r) for r in runs]
+    files = [self._log_files(r) for r in runs]
+    with _get_executor(workers, executor) as pool:
+      found = pool.map(_search_logs, files, [pattern] * len(runs), [logs] * len(runs))
+      frames = [df.assign(run=r) for r, df in zip(runs, found)]
+    if not frames:
+      return pd.DataFrame(columns=['run', 'log', 'line', 'offset', 'text'])
+    df = pd.concat(frames, ignore_index=True)
+    return df[['run', 'log', 'line', 'offset', 'text']]
+
+  def summarize_runs(self, ids=None, keys=None, columns=None, percentiles=(0.05, 0.5, 0.95), cte=(), sample=None, memory=SUMMARY_MEMORY, workers=None, executor='process', seed=None):
+    '''Statistics of the output across many runs (e.g. stochastic scenarios), by line item and period
+
+    Each worker reads its share of the runs one at a time and reduces them into running statistics,
+    which are combined at the end, so only one run's output (and a bounded sample of values) is held per worker.
+
+    Args:
+      ids (optional list): Runs to summarize. Default is all runs of the model.
+      keys (optional list): Columns identifying a cell, e.g. ['Line', 'Period']. Default is every non-float column.
+      columns (optional list): Value columns to summarize. Default is every other numeric column.
+      percentiles (optional list): Percentiles to compute, as fractions
+      cte (optional list): Levels of conditional tail expectation to compute, e.g. [0.7, 0.9] for the mean of the top 30% and 10%
+      sample (optional int): Compute percentiles and CTEs from a random sample of this many runs. Use 'all' to keep a
+        value per run per cell, for exact results however many runs there are (memory then grows with the runs).
+      memory (optional int): When sample is not given, compute percentiles and CTEs from a random sample of as many
+        runs as fit in this many bytes, at 8 bytes per cell per value column of a run, shared by the workers.
+        Default is SUMMARY_MEMORY (256 MB), and results are exact when every run fits. Computing the percentiles takes
+        about as much again.
+      workers (optional int): Number of workers
+      executor (optional str): 'process' (default) or 'thread'
+      seed (optional int): Seed for the sampling
+
+    Returns:
+      DataFrame indexed by the keys, with columns of (value column, statistic) for count, mean, std, min, max, percentiles and CTEs
+    '''
+    ids = self.runs if ids is None else [str(r) for r in ids]
+    if not ids:
+      raise ValueError('No runs to summarize.')
+    paths = [self._output_file(r) for r in ids]
+    if sample is not None:
+      sample, memory = None if sample == 'all' else sample, None
+    workers = min(workers or os.cpu_count() or 1, len(ids))
+    shares = [paths[i::workers] for i in range(workers)]
+    seeds = np.random.SeedSequence(seed).spawn(workers)
+    # Each worker keeps its share of the memory, and the combined sample the whole of it
+    share = None if memory is None else memory / workers
+    with _get_executor(workers, executor) as pool:
+      partials = list(pool.map(_summarize_runs, shares, [keys] * workers, [columns] * workers, [sample] * workers, seeds, [share] * workers))
+    stats = partials[0]
+    stats.memory = memory
+    for other in partials[1:]:
+      stats = stats.merge(other)
+    return stats.result(percentiles, cte)
+
+  def load_runs(self, ids=None, workers=None, columns=None, dtype=None, concat=True, executor='thread', progress=None):
+    '''Read the output of many runs at once
+
+    Runs are read across a pool of workers. A run that fails to load does not stop the others,
+    its error is collected and returned instead.
+
+    Args:
+      ids (optional list): Runs to read. Default is all runs of the model.
+      workers (optional int): Number of runs to read at once
+      columns (optional list): Only keep these output columns
+      dtype (optional): dtype schema, as for Run.load_output
+      concat (optional bool): Default is True, returning one DataFrame with a 'run' column. Otherwise a dict of run to DataFrame.
+      executor (optional str): 'thread' (default) or 'process'
+      progress (optional): Callable taking (number done, number of runs, run id), or True to print progress
+
+    Returns:
+      Tuple of the output (DataFrame or dict) and a dict of run id to the error raised for each run that failed
+    '''
+    ids = self.runs if ids is None else [str(r) for r in ids]
+    if progress is True:
+      progress = lambda done, total, r: print('Loaded run %s (%d/%d)'%(r, done, total), file=sys.stderr)
+    
+    frames = {}
+    errors = {}
+    with _get_executor(workers, executor) as pool:
+      futures = {}
+      for r in ids:
+        # Resolved here from the model's listing, so workers only read the file
+        try:
+          futures[pool.submit(_read_output, self._output_file(r), columns, dtype)] = r
+        except Exception as e:
+          errors[r] = e
+      for done, future in enumerate(concurrent.futures.as_completed(futures), len(errors) + 1):
+        r = futures[future]
+        try:
+          frames[r] = future.result()
+        except Exception as e:
+          errors[r] = e
+        if progress:
+          progress(done, len(ids), r)
+
+    return _combine_runs(ids, frames, concat), errors
+
+  async def aruns(self, limit=None):
+    '''Async counterpart of runs, listing the directory without blocking the event loop
+
+    Args:
+      limit (optional): Most blocking calls at once, as an int or an asyncio.Semaphore shared with other calls
+    '''
+    return await _blocking(_semaphore(limit), self._get_runs)
+
+  async def arun(self, r, limit=None):
+    '''Async counterpart of run, parsing the run's metadata without blocking the event loop
+
+    Args:
+      r (str): Run number
+      limit (optional): Most blocking calls at once, as an int or an asyncio.Semaphore shared with other calls
+    '''
+    return await _blocking(_semaphore(limit), self.run, r)
+
+  async def aload_runs(self, ids=None, columns=None, dtype=None, concat=True, limit=None):
+    '''Async counterpart of load_runs
+
+    The metadata and output reads of every run overlap, up to limit at once. Share a semaphore as the limit
+    to load many models from one event loop without swamping the file server.
+
+    Args:
+      ids (optional list): Runs to read. Default is all runs of the model.
+      columns, dtype, concat (optional): As for load_runs
+      limit (optional): Most blocking calls at once, as an int (default ASYNC_LIMIT) or an asyncio.Semaphore
+
+    Returns:
+      Tuple of the output (DataFrame or dict) and a dict of run id to the error raised for each run that failed
+
+    Examples:
+      Load two models' runs, at most 8 files at a time::
+
+        async def load(models):
+          limit = asyncio.Semaphore(8)
+          return await asyncio.gather(*[m.aload_runs(limit=limit) for m in models])
+    '''
+    limit = _semaphore(limit)
+    ids = await self.aruns(limit) if ids is None else [str(r) for r in ids]
+
+    async def load(r):
+      run = await self.arun(r, limit)
+      return await run.aoutput(columns, dtype, limit=limit)
+
+    results = await asyncio.gather(*[load(r) for r in ids], return_exceptions=True)
+    frames = {r: f for r, f in zip(ids, results) if not isinstance(f, BaseException)}
+    errors = {r: e for r, e in zip(ids, results) if isinstance(e, BaseException)}
+    return _combine_runs(ids, frames, concat), errors
 
   @property
   def runs(self):
     return self._get_runs()
 
+  @property
+  def inventory(self):
+    '''Listing of the model's runs, logs, reports and input files, see Inventory'''
+    return self._get_inventory()
+
   @property
   def dir(self):
     '''Path to model 
@@ -143,6 +1944,18 @@ class Model:
     '''
     return self._get_tableFiles()
   
+  @property
+  def table_data(self):
+    '''Contents of the model's table files, read on first use, see Tables
+
+    Examples:
+      Read one table, or every table in parallel::
+
+        m.table_data['Lapse']
+        tables, errors = m.table_data.load(workers=4)
+    '''
+    return self._get_tableData()
+
   @property
   def name(self):
     '''Name of the model, without the \*.ain2 extension'''
@@ -190,53 +2003,292 @@ class Model:
   def locked(self):
     '''
     Returns:
-      True if someone is using the model in ALFA, otherwise False
+      True if someone is using the model in ALFA, otherwise False
+    '''
+    return self._isLocked()
+  
+  @property
+  def excluded(self):
+    '''Which assets should be excluded from the model
+    
+    Returns:
+      A frozenset of asset identifiers, as strings
+    '''
+    return frozenset(self.__excluded)
+  
+  @excluded.setter
+  def excluded(self, v):
+    # Replace the excluded assets with the ones provided
+    self.__excluded = set()
+    self.exclude(v)
+
+def _scan_folder(directory):
+  '''Model files (\*.ain2) and sub folders of one folder'''
+  models, folders = [], []
+  try:
+    with os.scandir(directory) as entries:
+      for entry in entries:
+        if entry.is_dir():
+          if entry.name != CACHE_DIR:
+            folders.append(entry.path)
+        elif entry.name.lower().endswith('.ain2'):
+          models.append(entry.path)
+  except OSError:
+    # Folders that cannot be read are left out, as with os.walk
+    pass
+  return models, folders
+
+def _find_models(root, workers=None):
+  '''Every model file under root, listing folders side by side as they are found'''
+  found = []
+  with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+    pending = {pool.submit(_scan_folder, root)}
+    while pending:
+      done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+      for future in done:
+        models, folders = future.result()
+        found.extend(models)
+        pending |= {pool.submit(_scan_folder, folder) for folder in folders}
+  return sorted(found)
+
+class Portfolio(Mapping):
+  '''Every model under a root folder (e.g. a year of valuation folders), as a mapping of model key to Model
+
+  Models are keyed by their path under the root without the \*.ain2 extension (e.g. '083120/Assets_083120'), and the
+  folders are listed in parallel, which matters on network shares. Queries and loads run across every model at once,
+  with a bounded number of workers.
+
+  Examples:
+    Compare the base runs of every month of a year::
+
+      p = mg.Portfolio('P:/2020')
+      base = p.query(ProjectionDescription='Base')
+      df, errors = p.load_runs(base, columns=['Line', 'Period', 'Value'])
+  '''
+  def __init__(self, root, workers=None, persist_inventory=False):
+    '''
+    Args:
+      root (str): Folder to look for models under, at any depth
+      workers (optional int): Number of folders to list at once
+      persist_inventory (optional bool): Passed on to each Model
+    '''
+    if not os.path.isdir(root):
+      raise FileNotFoundError("Could not find the folder '%s'"%root)
+    self.root = root
+    self.__models = {}
+    for f in _find_models(root, workers):
+      key = os.path.splitext(os.path.relpath(f, root))[0].replace(os.sep, '/')
+      self.__models[key] = Model(f, persist_inventory=persist_inventory)
+
+  def __getitem__(self, key):
+    if key not in self.__models:
+      raise KeyError('No model "%s" under %s'%(key, self.root))
+    return self.__models[key]
+
+  def __iter__(self):
+    return iter(self.__models)
+
+  def __len__(self):
+    return len(self.__models)
+
+  def folder(self, key):
+    '''Folder of a model, relative to the root (e.g. '083120')'''
+    return key.rpartition('/')[0]
+
+  def runs_frame(self, workers=None):
+    '''Metadata of every run of every model, as one DataFrame
+
+    Returns:
+      DataFrame indexed by model key and run id, with the folder of each model and a column per metadata item
+    '''
+    keys = list(self.__models)
+    with _get_executor(workers) as pool:
+      frames = list(pool.map(lambda key: self.__models[key].runs_frame(), keys))
+    parts = [f.reset_index().assign(model=key, folder=self.folder(key)) for key, f in zip(keys, frames) if len(f)]
+    if not parts:
+      return pd.DataFrame(index=pd.MultiIndex.from_tuples([], names=['model', 'run']), columns=['folder'])
+    df = pd.concat(parts, ignore_index=True).set_index(['model', 'run'])
+    return df[['folder'] + [c for c in df.columns if c != 'folder']]
+
+  def query(self, where=None, **criteria):
+    '''Find runs across every model by their metadata, with criteria as for Model.query_runs
+
+    Returns:
+      DataFrame of the metadata of matching runs, indexed by model key and run id
+    '''
+    df = self.runs_frame()
+    return df.loc[_match_runs(df, dict(where or {}, **criteria))]
+
+  def _jobs(self, runs):
+    # (model key, run id) pairs from a frame indexed by them, a list of pairs, or None for every run
+    if runs is None:
+      return [(key, r) for key, m in self.__models.items() for r in m.runs]
+    if isinstance(runs, pd.DataFrame):
+      runs = runs.index
+    return [(key, str(r)) for key, r in runs]
+
+  def load_runs(self, runs=None, workers=None, columns=None, dtype=None, executor='thread'):
+    '''Read the output of runs across models at once
+
+    Args:
+      runs (optional): Runs to read, as a frame from query or runs_frame, or a list of (model key, run id).
+        Default is every run of every model.
+      workers (optional int): Number of runs to read at once
+      columns, dtype (optional): As for Model.load_runs
+      executor (optional str): 'thread' (default) or 'process'
+
+    Returns:
+      Tuple of one DataFrame with 'model' and 'run' columns, and a dict of (model key, run id) to the error raised
+      for each run that failed
     '''
-    return self._isLocked()
-  
-  @property
-  def excluded(self):
-    '''Which assets should be excluded from the model
-    
-    Returns:
-      A list of asset identifiers
+    jobs = self._jobs(runs)
+    frames, errors = {}, {}
+    with _get_executor(workers, executor) as pool:
+      futures = {}
+      for key, r in jobs:
+        try:
+          futures[pool.submit(_read_output, self[key]._output_file(r), columns, dtype)] = (key, r)
+        except Exception as e:
+          errors[(key, r)] = e
+      for future in concurrent.futures.as_completed(futures):
+        try:
+          frames[futures[future]] = future.result()
+        except Exception as e:
+          errors[futures[future]] = e
+    return _combine_models(jobs, frames), errors
+
+  async def aload_runs(self, runs=None, columns=None, dtype=None, limit=None):
+    '''Async counterpart of load_runs, with at most limit blocking reads at once across every model
+
+    Args:
+      runs, columns, dtype (optional): As for load_runs
+      limit (optional): Most blocking calls at once, as an int (default ASYNC_LIMIT) or an asyncio.Semaphore
     '''
-    return self.__excluded
-  
-  @excluded.setter
-  def excluded(self, v):
-    pass
+    limit = _semaphore(limit)
+    jobs = self._jobs(runs)
+    by_model = {}
+    for key, r in jobs:
+      by_model.setdefault(key, []).append(r)
+    results = await asyncio.gather(*[self[key].aload_runs(ids, columns, dtype, concat=False, limit=limit) for key, ids in by_model.items()])
+    frames, errors = {}, {}
+    for key, (loaded, failed) in zip(by_model, results):
+      frames.update({(key, r): df for r, df in loaded.items()})
+      errors.update({(key, r): e for r, e in failed.items()})
+    return _combine_models(jobs, frames), errors
 
-class Asset:
-  '''Instance of ALFA Input Asset. These are basically just text files
+def _combine_models(jobs, frames):
+  '''Output of runs across models as one DataFrame, in the order they were asked for, with 'model' and 'run' columns'''
+  parts = [frames[job].assign(model=job[0], run=job[1]) for job in jobs if job in frames]
+  if not parts:
+    return pd.DataFrame()
+  df = pd.concat(parts, ignore_index=True)
+  df['model'] = df['model'].astype('category')
+  df['run'] = df['run'].astype('category')
+  return df[['model', 'run'] + [c for c in df.columns if c not in ('model', 'run')]]
 
-  Attributes:
-    data: Underlying data for the AIA (all available segments)
-    output_dest (str): Where to save the \*.aia2 files upon building
+class _InputFile:
+  '''Common parts of the ALFA input files (AIA, AIL) built from tabular data
+
+  Subclasses give the file extension, the name of their definitions file and whether the model's exclusions apply.
   '''
+  extension = None
+  defs_name = None
+  excludes = False
+
   def __init__(self, name, mod = None):
     self.__name = name
-    self.__model = mod # Underlying model for which these AIAs are used
-    self.__outfile_name = '%s_%s.aia2' %('SEGNUMBER', self.__name)
+    self.__model = mod # Underlying model for which these inputs are used
+    self.__outfile_name = '%s_%s.%s' %('SEGNUMBER', self.__name, self.extension)
     self.__outputDest = None
+    self.__data = None
+    self.defs_file = None
+    # Column splitting the data into files
+    self.segment_column = 'segment'
+    # Column identifying each record, for exclusions. Default is the source of the first field in the definitions
+    self.id_column = None
+    # Format used for fields with a Date format in the definitions file
+    self.date_format = '%m/%d/%Y'
     
     if mod:
       if isinstance(mod, Model):
         # User provided a Model instance
         self.__outputDest = mod.dir
         # TODO: Let the following be dynamic
-        self.defs_file = os.path.join(mod.dir, 'AIA_Definitions.JSON')
+        self.defs_file = _find_file(mod.dir, self.defs_name)
       else:
         raise ValueError("mod parameter provided, but is not a Model instance.")
   
+  def _get_definitions(self):
+    # Parsed once per definitions file, and again only when the file changes
+    return _load_definitions(self.defs_file)
+
   def _get_fields(self):
-    # Read in the JSON definitions file
-    with open(self.defs_file, 'r') as f:
-      j = json.load(f)
-    
-    # Use self.name to get the aia definitions
-    return list(j[self.name].keys())
+    # Use self.name to get the definitions
+    return list(self._get_definitions()['defs'][self.name].keys())
+
+  def _get_plan(self):
+    defs = self._get_definitions()
+    if self.name not in defs['plans']:
+      if self.name not in defs['defs']:
+        raise KeyError('"%s" is not defined in %s'%(self.name, self.defs_file))
+      defs['plans'][self.name] = _compile_plan(defs['defs'][self.name])
+    return defs['plans'][self.name]
+
+  def format(self, df=None):
+    '''Map data into the layout given by the definitions file
+
+    Each field takes the source column named in its Value (e.g. [a_cusip_cd]), or the Value itself as a literal,
+    and applies its Format (ZeroPad(n), Integer, Date or None) to the whole column at once. Each date is read on its
+    own, and one that cannot be read raises ValueError rather than being written blank.
+
+    Args:
+      df (optional DataFrame): Data to format. Default is the data attribute.
+
+    Returns:
+      DataFrame with one column per field, in the order of the field indexes
+    '''
+    df = self.__data if df is None else df
+    return _apply_plan(self._get_plan(), df, self.date_format)
   
+  def validate(self, df=None):
+    '''Check data against the definitions file, every row and field at once, before building
+
+    Each column is checked as a whole, and slow checks (such as reading dates) are made once per distinct value.
+    Missing values pass, as they are written blank. The rules are
+
+      missing column: The data has no column for the field's Value
+      integer: An Integer or ZeroPad(n) value that is not a whole number
+      zeropad: A ZeroPad(n) value that is negative or has more than n digits
+      date: A Date value that cannot be read as a date
+      width: A value longer, once formatted, than the field's Width, for definitions that give one
+      delimiter: A value containing a tab or line break, which would break the layout of the file
+
+    Args:
+      df (optional DataFrame): Data to check. Default is the data attribute.
+
+    Returns:
+      DataFrame with the row (index label), field, rule and value of each error, empty when the data is fine.
+      Errors of a whole field (a missing column, or a bad literal Value) have no row and come first.
+    '''
+    df = self.__data if df is None else df
+    if df is None:
+      raise ValueError('No data to validate. Set the data attribute first.')
+    fields = self._get_definitions()['defs'][self.name]
+    widths = {field: int(spec['Width']) for field, spec in fields.items() if 'Width' in spec}
+    return _validate_plan(self._get_plan(), widths, df, self.date_format)
+
+  @property
+  def data(self):
+    '''Underlying data for the input file, as a DataFrame with a segment_column column'''
+    return self.__data
+
+  @data.setter
+  def data(self, val):
+    if isinstance(val, pd.DataFrame):
+      self.__data = val
+    else:
+      raise ValueError('Must provide a DataFrame.')
+
   @property
   def output_dest(self):
     return self.__outputDest
@@ -251,12 +2303,12 @@ class Asset:
   
   @property
   def outfile_name(self):
-    '''Tells user how the AIA output file will be named'''
+    '''Tells user how the output file will be named'''
     return self.__outfile_name
   
   @outfile_name.setter
   def outfile_name(self, val):
-    '''This will be the name of the resulting AIA outfile'''
+    '''This will be the name of the resulting outfile'''
     if isinstance(val, str):
       self.__outfile_name = val
     else:
@@ -274,95 +2326,838 @@ class Asset:
   def fields(self):
     '''
     Returns:
-      List of fields used by the AIA, per the definitions file
+      List of fields used by the input file, per the definitions file
 
     '''
     return self._get_fields()
   
-  def build(self, segs='all'):
-    '''Build the AIAs using the data attribute
+  @_instrumented('%s.build')
+  def build(self, segs='all', workers=None, executor='thread', incremental=False, validate=False):
+    '''Build the input files using the data attribute
+
+    Rows of other segments and assets excluded from the model are dropped first. When the definitions file exists,
+    the data is then mapped into its layout (see format), otherwise it is written as is.
+    The data is split into segments in a single pass and the segment files are written concurrently.
 
     Args:
-      seg (optional list): Default is 'all'. Use to specify which segments to build. Each segment has its own file for output.
+      segs (optional list): Default is 'all'. Use to specify which segments to build. Each segment has its own file for output.
+      workers (optional int): Number of files to write at once. Default lets the pool decide.
+      executor (optional str): 'thread' (default) or 'process' pool for writing the files
+      incremental (optional bool): Default is False. Only format and write the files whose rows, definitions or formats
+        changed since the last incremental build, going by the hashes it kept in the .pyalfa folder of output_dest.
+      validate (optional bool): Default is False. Check the rows of the segments being built first (see validate),
+        writing nothing when they have errors.
     
+    Returns:
+      DataFrame manifest with the segment, file, rows, excluded rows and bytes of each file, and whether it was written
+
     TODO:
-      Provide str-int flexibility (and zeropadness)
-      Use AIA Definitions file 
-      Exclude excluded Assets
+      Provide zeropadness of segment numbers
     '''
-    # Handle provided segments
-    if isinstance(segs, str):
-      segs = [segs] if segs.lower() != 'all' else list(self.__data['segment'].unique())
-      
-    elif not isinstance(segs, list):
-      raise ValueError('Segments should be a str or a list of strings.')
-    
-    # Get the data we want
-    df = self.__data
+    if self.__data is None:
+      raise ValueError('No data to build from. Set the data attribute first.')
+
+    segs = self._get_segs(segs)
+    split = 'SEGNUMBER_' in self.outfile_name
+    data = self.__data
+    if segs is not None:
+      # Exclusions, checks and formatting only look at the rows of the segments being built
+      data = data.loc[data[self.segment_column].astype(str).isin(segs).to_numpy()]
+    data, excluded = self._exclude(data)
+    if validate and self.defs_file and os.path.exists(self.defs_file):
+      errors = self.validate(data)
+      if len(errors):
+        counts = errors.groupby(['field', 'rule'], sort=False).size()
+        raise ValueError('Data has %d errors, see validate(): %s'%(len(errors), ', '.join('%s %s (%d)'%(f, r, n) for (f, r), n in counts.items())))
+    if not split:
+      # Put everything into the same file for the provided segments
+      label = 'all' if segs is None else ','.join(segs)
+      excluded = {label: sum(excluded.values())}
+
+    if incremental:
+      built = self._read_built()
+      hashes, unchanged = self._unchanged(data, segs, excluded, built)
+      if split and segs is None:
+        segs = list(hashes)
+      keep = ~data[self.segment_column].astype(str).isin(unchanged).to_numpy() if split else np.repeat(label not in unchanged, len(data))
+      data = data.loc[keep]
+    else:
+      unchanged = {}
+    df, segments = self._format_data(data)
+
+    if split:
+      # Create separate files for each segment
+      # Split the data into segments once, rather than filtering it per segment
+      parts = _split_segments(df, segments)
+      if segs is None:
+        # A segment whose rows were all excluded still gets its (empty) file
+        segs = list(parts.keys()) + [seg for seg in excluded if seg not in parts]
+      jobs = [(seg, self._outfile(seg), parts.get(seg, df.iloc[:0])) for seg in segs if seg not in unchanged]
+    else:
+      segs = [label]
+      jobs = [(label, self._outfile(), df)] if label not in unchanged else []
     
-    ## Filter Data to desired segments
-    subset = df.loc[df['segment'].isin(segs)]
+    # Output the data to text files
+    if len(jobs) == 1:
+      sizes = [_write_segment(jobs[0][1], jobs[0][2])]
+    else:
+      with _get_executor(workers, executor) as pool:
+        sizes = list(pool.map(_write_segment, [j[1] for j in jobs], [j[2] for j in jobs]))
+
+    files = dict(unchanged)
+    for (seg, outfile, part), size in zip(jobs, sizes):
+      files[seg] = {'file': outfile, 'rows': len(part), 'excluded': excluded.get(seg, 0), 'bytes': size}
+    if incremental:
+      for seg, entry in files.items():
+        built[seg] = dict(entry, hash=hashes[seg])
+      self._write_built(built)
+
+    return _manifest({
+      'segment': segs
+      ,'file': [files[seg]['file'] for seg in segs]
+      ,'rows': [files[seg]['rows'] for seg in segs]
+      ,'excluded': [files[seg]['excluded'] for seg in segs]
+      ,'bytes': [files[seg]['bytes'] for seg in segs]
+      ,'written': [seg not in unchanged for seg in segs]
+    })
+
+  def _built_path(self):
+    return os.path.join(self.output_dest or '.', CACHE_DIR, '%s.%s.built.json'%(self.name, self.extension))
+
+  def _read_built(self):
+    '''Files written by earlier incremental builds to output_dest, by segment'''
+    try:
+      with open(self._built_path(), 'r') as f:
+        return json.load(f)
+    except (OSError, ValueError):
+      return {}
+
+  def _write_built(self, built):
+    try:
+      os.makedirs(os.path.dirname(self._built_path()), exist_ok=True)
+      with open(self._built_path(), 'w') as f:
+        json.dump(built, f)
+    except OSError:
+      pass
+
+  def _version(self, df):
+    '''Everything besides the rows that the files depend on: definitions, formats, file names and columns'''
+    defs = self._get_definitions()['defs'].get(self.name) if self.defs_file and os.path.exists(self.defs_file) else None
+    return json.dumps([defs, self.date_format, self.outfile_name, [(str(c), str(t)) for c, t in df.dtypes.items()]], sort_keys=True, default=str)
 
-    # Determine if we should aggregate the data
+  def _unchanged(self, data, segs, excluded, built):
+    '''Which files an earlier incremental build already wrote from the same rows, definitions and formats
+
+    Returns:
+      Tuple of the hash of each file's rows, and the entries of built for the files that are unchanged
+    '''
+    version = self._version(data)
     if 'SEGNUMBER_' in self.outfile_name:
-      # Create separate files for each segment
-      # Loop through segments
-      for seg in segs:
-        outfile = self.outfile_name.replace('SEGNUMBER', seg)
-        sub = subset.loc[subset['segment']==seg]
-        sub.to_csv(outfile, sep = '\t', index = False, header=False)     
+      hashes = _segment_hashes(data, data[self.segment_column], version)
+      keys = list(hashes) + [seg for seg in excluded if seg not in hashes] if segs is None else segs
     else:
-      # Put everything into the same file for the provided segments
-      outfile = self.outfile_name
-      # Output the AIA data to text file
-      subset.to_csv(outfile, sep = '\t', index = False, header=False)      
+      keys = list(excluded)
+      hashes = _segment_hashes(data, np.repeat(keys[0], len(data)), version)
+    # Files without rows
+    empty = hashlib.blake2b(version.encode('utf-8'), digest_size=16).hexdigest()
+    hashes = {seg: hashes.get(seg, empty) for seg in keys}
+
+    unchanged = {}
+    for seg in keys:
+      entry = built.get(seg)
+      if entry is None or entry['hash'] != hashes[seg] or entry['excluded'] != excluded.get(seg, 0):
+        continue
+      try:
+        # A file changed or removed since is written again
+        if os.path.getsize(entry['file']) == entry['bytes']:
+          unchanged[seg] = {k: v for k, v in entry.items() if k != 'hash'}
+      except OSError:
+        pass
+    return hashes, unchanged
+
+  @_instrumented('%s.build_stream')
+  def build_stream(self, source, segs='all', chunksize=100000, workers=None, **kwargs):
+    '''Build the input files from a source too large to hold in memory
+
+    The source is read a chunk at a time, and each chunk is formatted and appended to the files of its segments,
+    so memory use depends on chunksize rather than on the size of the source. The files written are the same as
+    build would write for the whole source in memory: numbers are written the same way whether a chunk reads them as
+    integers or, because of a blank, as floats.
+
+    Args:
+      source: Path to a CSV or Parquet file, a DataFrame or an iterator of DataFrames
+      segs (optional list): Default is 'all'. Use to specify which segments to build.
+      chunksize (optional int): Rows to read at a time from a file source
+      workers (optional int): Number of segment files to append to at once
+      kwargs: Passed on to pd.read_csv for CSV sources (e.g. dtype)
+
+    Returns:
+      DataFrame manifest with the segment, file, rows and bytes of each file written
+    '''
+    segs = self._get_segs(segs)
+    split = 'SEGNUMBER_' in self.outfile_name
+    label = 'all' if segs is None else ','.join(segs)
+    handles = {}
+    rows = {}
+    excluded = {}
+
+    def open_file(seg):
+      # Truncate each file on first use, then keep appending to it
+      outfile = self._outfile(seg) if split else self._outfile()
+      handles[seg] = (outfile, open(outfile, 'w', newline='', encoding='utf-8'))
+      rows[seg] = 0
+
+    def append(seg, part):
+      part.to_csv(handles[seg][1], sep = '\t', index = False, header=False, float_format=FLOAT_FORMAT)
+      rows[seg] += len(part)
+
+    try:
+      with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        for chunk in _iter_chunks(source, chunksize, **kwargs):
+          df, segments, dropped = self._prepare(chunk)
+          for seg, n in dropped.items():
+            if segs is None or seg in segs:
+              key = seg if split else label
+              if key not in handles:
+                open_file(key)
+              excluded[key] = excluded.get(key, 0) + n
+          if split:
+            parts = _split_segments(df, segments)
+            keys = [seg for seg in parts if segs is None or seg in segs]
+            for seg in keys:
+              if seg not in handles:
+                open_file(seg)
+            # Each segment has its own file, so the appends can happen side by side
+            list(pool.map(lambda seg: append(seg, parts[seg]), keys))
+          else:
+            if label not in handles:
+              open_file(label)
+            append(label, df if segs is None else df.loc[segments.astype(str).isin(segs)])
+
+      # Segments that were asked for but never seen still get an (empty) file, as with build
+      for seg in (segs or []) if split else [label]:
+        if seg not in handles:
+          open_file(seg)
+    finally:
+      for outfile, handle in handles.values():
+        handle.close()
+
+    return _manifest({
+      'segment': list(handles.keys())
+      ,'file': [outfile for outfile, handle in handles.values()]
+      ,'rows': [rows[seg] for seg in handles]
+      ,'excluded': [excluded.get(seg, 0) for seg in handles]
+      ,'bytes': [os.path.getsize(outfile) for outfile, handle in handles.values()]
+    })
+
+  def _get_segs(self, segs):
+    '''Normalise the segments asked for into a list of str, or None for all segments'''
+    if isinstance(segs, (str, int)):
+      return [str(segs)] if str(segs).lower() != 'all' else None
+    elif isinstance(segs, list):
+      return [str(seg) for seg in segs]
+    else:
+      raise ValueError('Segments should be a str or a list of strings.')
+
+  def _prepare(self, df):
+    '''Drop excluded records and format data for output
+
+    Returns:
+      Tuple of the data, the segment of each of its rows, and a dict of segment to number of rows excluded
+    '''
+    df, excluded = self._exclude(df)
+    df, segments = self._format_data(df)
+    return df, segments, excluded
+
+  def _exclude(self, df):
+    '''Drop excluded records
+
+    Returns:
+      Tuple of the data and a dict of segment to number of rows excluded
+    '''
+    excluded = {}
+    if self.excludes and self.model is not None and self.model.excluded:
+      mask = _id_strings(df[self._get_id_column()]).isin(self.model.excluded).to_numpy()
+      if mask.any():
+        excluded = df[self.segment_column][mask].astype(str).value_counts().to_dict()
+        df = df.loc[~mask]
+    return df, excluded
+
+  def _format_data(self, df):
+    '''Format data for output, when there are definitions
+
+    Returns:
+      Tuple of the data and the segment of each of its rows
+    '''
+    segments = df[self.segment_column]
+    if self.defs_file and os.path.exists(self.defs_file):
+      df = self.format(df)
+    return df, segments
+
+  def _get_id_column(self):
+    if self.id_column:
+      return self.id_column
+    if self.defs_file and os.path.exists(self.defs_file):
+      for field, source, literal, fmt, arg in self._get_plan():
+        if source is not None:
+          return source
+    raise ValueError('Cannot tell which column identifies records to exclude. Set the id_column attribute.')
+
+  def _outfile(self, seg=None):
+    '''Full path of the output file for a segment'''
+    outfile = self.outfile_name.replace('SEGNUMBER', seg) if seg is not None else self.outfile_name
+    return os.path.join(self.output_dest, outfile) if self.output_dest else outfile
+
+class Asset(_InputFile):
+  '''Instance of ALFA Input Asset. These are basically just text files
+
+  Assets excluded from the model (see Model.exclude) are left out when building.
+
+  Attributes:
+    data: Underlying data for the AIA (all available segments)
+    output_dest (str): Where to save the \*.aia2 files upon building
+  '''
+  extension = 'aia2'
+  defs_name = 'AIA_Definitions.JSON'
+  excludes = True
+
+def _open_paths(paths):
+  '''Scenario paths as an array, memory mapping them when given the path to a .npy file'''
+  if isinstance(paths, str):
+    paths = np.load(paths, mmap_mode='r')
+  paths = paths if isinstance(paths, np.ndarray) else np.asarray(paths)
+  if paths.ndim == 2:
+    # A single curve
+    paths = paths[:, :, np.newaxis]
+  if paths.ndim != 3:
+    raise ValueError('Scenario paths should have 3 dimensions (scenarios x periods x curves), not %d'%paths.ndim)
+  return paths
+
+def _write_scenarios(paths, scens, outfiles, header, float_format):
+  '''Write a batch of scenario files, returning their sizes in bytes
+
+  paths is an array, or the path to a .npy file that is memory mapped again here, so that process pools
+  do not have to copy the scenarios to their workers.
+  '''
+  paths = _open_paths(paths)
+  periods, curves = paths.shape[1:]
+  # One format string for the whole file, filled from a buffer reused for every scenario
+  template = header + ('%d' + ('\t' + float_format) * curves + '\n') * periods
+  buf = np.empty((periods, curves + 1))
+  buf[:, 0] = np.arange(periods)
+  sizes = []
+  for scen, outfile in zip(scens, outfiles):
+    buf[:, 1:] = paths[scen]
+    data = (template % tuple(buf.ravel().tolist())).encode('utf-8')
+    with open(outfile, 'wb') as f:
+      f.write(data)
+    sizes.append(len(data))
+  return sizes
+
+class Scenario:
+  '''Batch of ALFA scenario (Agu) files, built from arrays of rate and equity paths
+
+  Each scenario is written as a tab-delimited file with a header row of curve names and one row per projection period.
+
+  Attributes:
+    paths: Array of scenarios x periods x curves. A path to a .npy file is memory mapped, so the scenarios
+      are only read as they are written.
+    curves (list): Name of each curve, for the header row
+    output_dest (str): Where to save the \*.agu files upon building
+    outfile_name (str): How the files are named. SCENNUMBER is replaced with the scenario number, from 1.
+    float_format (str): Format of the values
+  '''
+  def __init__(self, paths, curves=None, mod = None):
+    self.__source = paths
+    self.__paths = _open_paths(paths)
+    self.curves = list(curves) if curves is not None else ['Curve%d'%(i + 1) for i in range(self.__paths.shape[2])]
+    if len(self.curves) != self.__paths.shape[2]:
+      raise ValueError('%d curve names given for %d curves'%(len(self.curves), self.__paths.shape[2]))
+    self.outfile_name = 'Scenario_SCENNUMBER.agu'
+    self.float_format = '%.6f'
+    self.__outputDest = None
     
+    if mod:
+      if isinstance(mod, Model):
+        self.__outputDest = mod.dir
+      else:
+        raise ValueError("mod parameter provided, but is not a Model instance.")
+
+  @property
+  def paths(self):
+    return self.__paths
+
+  @property
+  def output_dest(self):
+    return self.__outputDest
+  
+  @output_dest.setter
+  def output_dest(self, val):
+    # Ensure that val is a valid location
+    if os.path.exists(val):
+      self.__outputDest = val
+    else: 
+      raise NotADirectoryError('Must provide a directory for output_dest')
+
+  def _outfile(self, scen):
+    '''Full path of the file for a scenario (numbered from 0 here, from 1 in the file name)'''
+    width = len(str(self.__paths.shape[0]))
+    outfile = self.outfile_name.replace('SCENNUMBER', str(scen + 1).zfill(width))
+    return os.path.join(self.output_dest, outfile) if self.output_dest else outfile
+
+  def build(self, scens='all', workers=None, executor='thread', batch=64):
+    '''Write the scenario files
+
+    Each file is formatted with a single string formatting call, and batches of files are written across a pool.
+
+    Args:
+      scens (optional list): Default is 'all'. Scenario numbers (from 1) to write.
+      workers (optional int): Number of batches to write at once
+      executor (optional str): 'thread' (default) or 'process'. Memory mapped paths are opened again by each process rather than copied.
+      batch (optional int): Number of scenarios written by a worker at a time
+
+    Returns:
+      DataFrame manifest with the scenario, file and bytes of each file written
+    '''
+    n = self.__paths.shape[0]
+    scens = list(range(n)) if isinstance(scens, str) and scens.lower() == 'all' else [int(i) - 1 for i in scens]
+    for i in scens:
+      if not 0 <= i < n:
+        raise ValueError('There is no scenario %d, only 1 to %d'%(i + 1, n))
+    header = '\t'.join(['Period'] + self.curves) + '\n'
+    outfiles = [self._outfile(i) for i in scens]
+    # Processes map a .npy file themselves, anything else is passed a batch at a time
+    mapped = isinstance(self.__source, str) and executor == 'process'
+    batches = [(scens[i:i + batch], outfiles[i:i + batch]) for i in range(0, len(scens), batch)]
+    with _get_executor(workers, executor) as pool:
+      futures = [
+        pool.submit(_write_scenarios, self.__source, b, f, header, self.float_format) if mapped
+        else pool.submit(_write_scenarios, np.asarray(self.__paths[b]), range(len(b)), f, header, self.float_format)
+        for b, f in batches
+      ]
+      sizes = [size for future in futures for size in future.result()]
+    return pd.DataFrame({'scenario': [i + 1 for i in scens], 'file': outfiles, 'bytes': sizes})
+
+class Reports(Mapping):
+  '''The report files of a run, as a mapping of report key (e.g. '006.Subtotal001') to DataFrame
+
+  Files are found with a single directory scan and each one is read only when first asked for.
+
+  Attributes:
+    index: DataFrame of the report files, with their report number, Total/Subtotal level and number
+  '''
+  pattern = re.compile(r'\.Rreq\.(\d+)\.(Total|Subtotal)(\d+)\.txt$', re.IGNORECASE)
+
+  def __init__(self, files):
+    self.__files = {}
+    rows = []
+    for f in sorted(files):
+      m = self.pattern.search(f)
+      if m:
+        key = self.key(f)
+        self.__files[key] = f
+        rows.append((key, m[1], m[2].capitalize(), m[3], f))
+    self.index = pd.DataFrame(rows, columns=['key', 'report', 'level', 'number', 'file'])
+    self.__loaded = {}
+
+  @classmethod
+  def key(cls, f):
+    '''Key of a report file (e.g. '006.Subtotal001'), or None when it is not one'''
+    m = cls.pattern.search(f)
+    return '%s.%s%s'%(m[1], m[2], m[3]) if m else None
+
+  def __getitem__(self, key):
+    if key not in self.__files:
+      raise KeyError('No report "%s". Available reports are: %s'%(key, ', '.join(self.__files)))
+    if key not in self.__loaded:
+      self.__loaded[key] = _read_output(self.__files[key])
+    return self.__loaded[key]
+
+  def __contains__(self, key):
+    # Mapping's default looks the key up, which would read the report
+    return key in self.__files
+
+  def __iter__(self):
+    return iter(self.__files)
+
+  def __len__(self):
+    return len(self.__files)
+
+  def file(self, key):
+    '''Path to the file of a report'''
+    return self.__files[key]
+
+  def _read(self, key, columns=None, dtype=None, cache=True):
+    # Some columns of a report, from the copy already read if there is one
+    if key in self.__loaded:
+      df = self.__loaded[key]
+      return _apply_dtype(df[list(columns)] if columns is not None else df, dtype)
+    return _read_output(self.__files[key], columns, dtype, cache)
+
+  def load(self, keys=None, workers=None, columns=None, dtype=None):
+    '''Read several reports at once, in parallel
+
+    Reports are kept once read, as when looked up one at a time, and only those not read yet are read.
+
+    Args:
+      keys (optional list): Reports to read. Default is all of them.
+      workers (optional int): Number of files to read at once
+      columns (optional list): Only keep these columns
+      dtype (optional): dtype schema, as for Run.load_output
+
+    Returns:
+      dict of report key to DataFrame
+    '''
+    keys = list(self.__files) if keys is None else list(keys)
+    for key in keys:
+      if key not in self.__files:
+        raise KeyError('No report "%s"'%key)
+    todo = [key for key in keys if key not in self.__loaded]
+    with _get_executor(workers) as pool:
+      for key, df in zip(todo, pool.map(_read_output, [self.__files[key] for key in todo])):
+        self.__loaded[key] = df
+    return {key: self._read(key, columns, dtype) for key in keys}
+
+def _numeric_columns(df):
+  '''Convert the text columns that are all numbers'''
+  for c in df.columns:
+    try:
+      df[c] = pd.to_numeric(df[c])
+    except (ValueError, TypeError):
+      pass
+  return df
+
+def _parse_xml_table(path):
+  '''Rows of an XML table: the most repeated element under one parent, with its attributes and children as columns'''
+  rows = []
+  for parent in ET.parse(path).getroot().iter():
+    by_tag = {}
+    for child in parent:
+      by_tag.setdefault(child.tag, []).append(child)
+    for children in by_tag.values():
+      if len(children) > len(rows):
+        rows = children
+  records = []
+  for row in rows:
+    record = dict(row.attrib)
+    for field in row:
+      record[field.tag.split('}')[-1]] = field.text
+    if not record:
+      record['value'] = row.text
+    records.append(record)
+  return _numeric_columns(pd.DataFrame(records))
+
+def _parse_table(path):
+  '''Read a table file, telling its layout from its contents
+
+  Table files saved as workbooks (zip files) are read from their first sheet, XML files from their most repeated
+  element, and anything else as delimited text with the delimiter sniffed from the start of the file.
+  '''
+  with open(path, 'rb') as f:
+    head = f.read(65536)
+  if head.startswith(b'PK\x03\x04'):
+    # Named, as pandas cannot tell a workbook's format from its contents when the extension is .atb2x
+    return pd.read_excel(path, sheet_name=0, engine='openpyxl')
+  text = head.decode('utf-8', 'replace').lstrip('\ufeff \t\r\n')
+  if text.startswith('<'):
+    return _parse_xml_table(path)
+  try:
+    sep = csv.Sniffer().sniff(text, delimiters='\t,;|').delimiter
+  except csv.Error:
+    sep = '\t'
+  return pd.read_csv(path, sep=sep)
+
+def _read_table(path, cache=True):
+  '''Read a table file, or its binary copy in the cache when the file has not changed since'''
+  if cache:
+    df = _read_cache(path, '.npz')
+    if df is not None:
+      return df
+  df = _parse_table(path)
+  instrumentation.record(bytes_read=os.path.getsize(path), rows=len(df), files=1)
+  if cache:
+    _write_cache(path, '.npz', df)
+  return df
+
+class Tables(Mapping):
+  '''The table files (\*.atb2x) of a model, as a mapping of table name (the file name without .atb2x) to DataFrame
+
+  Each table is parsed only when first asked for. Parsed tables are also cached on disk in the .pyalfa folder next to
+  them, keyed on the file's size and mtime, so later jobs only parse a table again once it changes.
+  '''
+  def __init__(self, files):
+    self.__files = {os.path.basename(f)[:-len('.atb2x')]: f for f in sorted(files)}
+    self.__loaded = {}
+
+  def __getitem__(self, name):
+    if name not in self.__files:
+      raise KeyError('No table "%s". Available tables are: %s'%(name, ', '.join(self.__files)))
+    if name not in self.__loaded:
+      self.__loaded[name] = _read_table(self.__files[name])
+    return self.__loaded[name]
+
+  def __contains__(self, name):
+    # Mapping's default looks the name up, which would read the table
+    return name in self.__files
+
+  def __iter__(self):
+    return iter(self.__files)
+
+  def __len__(self):
+    return len(self.__files)
+
+  def file(self, name):
+    '''Path to the file of a table'''
+    return self.__files[name]
+
+  def load(self, names=None, workers=None, executor='thread'):
+    '''Read several tables at once, in parallel
+
+    A table that fails to parse does not stop the others, its error is collected and returned instead.
+
+    Args:
+      names (optional list): Tables to read. Default is all of them.
+      workers (optional int): Number of files to read at once
+      executor (optional str): 'thread' (default) or 'process'
+
+    Returns:
+      Tuple of a dict of table name to DataFrame, and a dict of table name to the error raised for each table that failed
+    '''
+    names = list(self.__files) if names is None else list(names)
+    for name in names:
+      if name not in self.__files:
+        raise KeyError('No table "%s"'%name)
+    errors = {}
+    with _get_executor(workers, executor) as pool:
+      futures = {pool.submit(_read_table, self.__files[name]): name for name in names if name not in self.__loaded}
+      for future in concurrent.futures.as_completed(futures):
+        try:
+          self.__loaded[futures[future]] = future.result()
+        except Exception as e:
+          errors[futures[future]] = e
+    return {name: self.__loaded[name] for name in names if name in self.__loaded}, errors
+
+def _search_logs(available, pattern, logs=None):
+  '''Search the logs named in logs (default all) out of a dict of log name to path'''
+  names = list(available) if logs is None else [l.lower() for l in logs if l.lower() in available]
+  frames = [LogFile(available[name]).search(pattern).assign(log=name) for name in names]
+  if not frames:
+    return pd.DataFrame(columns=['log', 'line', 'offset', 'text'])
+  df = pd.concat(frames, ignore_index=True)
+  return df[['log', 'line', 'offset', 'text']]
+
+def _count_lines(mm, start, end, blocksize=1 << 20):
+  '''Newlines in mm[start:end], counted a block at a time so that a long gap between matches is never copied whole'''
+  n = 0
+  for pos in range(start, end, blocksize):
+    n += mm[pos:min(pos + blocksize, end)].count(b'\n')
+  return n
+
+class LogFile:
+  '''A debug or grid log of a run, read without loading the whole file into memory
+
+  Searches run over a memory map of the file, and the warnings and errors found are indexed once per
+  version of the file and cached next to it.
+
+  Attributes:
+    path (str): Path to the log file
+  '''
+  levels = re.compile(rb'\b(error|warning|fatal)\b', re.IGNORECASE)
 
-class Liability:
-  pass
+  def __init__(self, path):
+    self.path = path
 
-class Run(Model): # We want to pass some model methods
+  def __repr__(self):
+    return 'LogFile(%r)'%self.path
+
+  def search(self, pattern, flags=re.IGNORECASE):
+    '''Find the lines of the log matching a regex
+
+    Args:
+      pattern: Regex, as a str or bytes
+      flags (optional): re flags. Default is re.IGNORECASE.
+
+    Returns:
+      DataFrame with the line number (from 1), byte offset and text of each matching line
+    '''
+    if isinstance(pattern, str):
+      pattern = pattern.encode('utf-8')
+    regex = re.compile(pattern, flags | re.MULTILINE)
+    rows = []
+    with open(self.path, 'rb') as f:
+      if os.fstat(f.fileno()).st_size == 0:
+        return pd.DataFrame(rows, columns=['line', 'offset', 'text'])
+      with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        line, counted, end = 1, 0, -1
+        for m in regex.finditer(mm):
+          if m.start() <= end:
+            # Already reported this line
+            continue
+          start = mm.rfind(b'\n', 0, m.start()) + 1
+          end = mm.find(b'\n', m.end())
+          end = len(mm) if end < 0 else end
+          # Count lines only between matches, rather than over the whole file
+          line += _count_lines(mm, counted, start)
+          counted = start
+          rows.append((line, start, mm[start:end].rstrip(b'\r').decode('utf-8', 'replace')))
+    return pd.DataFrame(rows, columns=['line', 'offset', 'text'])
+
+  def index(self):
+    '''Warnings and errors in the log, found once per version of the file
+
+    Returns:
+      DataFrame with the line number, byte offset, level and text of each warning or error
+    '''
+    df = _read_cache(self.path, '.idx.npz')
+    if df is not None:
+      return df
+    df = self.search(self.levels.pattern)
+    df.insert(2, 'level', df['text'].str.extract('(error|warning|fatal)', flags=re.IGNORECASE)[0].str.lower())
+    _write_cache(self.path, '.idx.npz', df)
+    return df
+
+  @property
+  def errors(self):
+    '''Errors (and fatal errors) found in the log'''
+    df = self.index()
+    return df.loc[df['level'] != 'warning']
+
+  @property
+  def warnings(self):
+    '''Warnings found in the log'''
+    df = self.index()
+    return df.loc[df['level'] == 'warning']
+
+  def tail(self, n=10, blocksize=65536):
+    '''Last n lines of the log, read from the end of the file'''
+    with open(self.path, 'rb') as f:
+      pos = f.seek(0, os.SEEK_END)
+      data = b''
+      while pos > 0 and data.count(b'\n') <= n:
+        step = min(blocksize, pos)
+        pos -= step
+        f.seek(pos)
+        data = f.read(step) + data
+    lines = data.decode('utf-8', 'replace').splitlines()
+    return lines[-n:] if n else []
+
+  def follow(self, interval=1.0, timeout=None):
+    '''Yield lines as they are written to the log, like tail -f
+
+    Args:
+      interval (optional float): Seconds to wait between checks for new lines
+      timeout (optional float): Stop after this many seconds without a new line. Default is to keep following.
+    '''
+    # Lines written from now on are followed, even if the first one is only asked for later
+    return self._follow(os.path.getsize(self.path), interval, timeout)
+
+  def _follow(self, start, interval, timeout):
+    with open(self.path, 'rb') as f:
+      f.seek(start)
+      pending = b''
+      waited = 0.0
+      while timeout is None or waited < timeout:
+        chunk = f.readline()
+        if not chunk:
+          time.sleep(interval)
+          waited += interval
+          continue
+        waited = 0.0
+        pending += chunk
+        if pending.endswith(b'\n'):
+          yield pending.rstrip(b'\r\n').decode('utf-8', 'replace')
+          pending = b''
+
+class Liability(_InputFile):
+  '''Instance of ALFA Input Liability, built like an Asset from (policy level) data
+
+  Definitions are read from AIL_Definitions.JSON in the model directory, in the same layout as AIA_Definitions.JSON.
+  Set segment_column (e.g. to 'plan') to split the files by something other than segment.
+  Use build_stream for extracts too large to hold in memory.
+
+  Attributes:
+    data: Underlying data for the AIL (all available segments)
+    output_dest (str): Where to save the \*.ail2 files upon building
+  '''
+  extension = 'ail2'
+  defs_name = 'AIL_Definitions.JSON'
+
+
+class Run:
   '''An ALFA run
+
+  Runs are kept small, so that studies can hold thousands of them: a run refers to its model rather than copying it,
+  and anything not defined here (e.g. dir, name, inventory) is looked up on the model. Metadata strings are interned,
+  so runs with the same descriptions and dates share them.
   
   Attributes:
+    model: The Model the run belongs to
     metadata
-  
-  TODO:
-    Add '_' prefix to \*kwargs, maybe...
-      OR: have an attribute called 'meta' that contains all that info. Yeah I like that better...
   '''
+  __slots__ = ('model', '__metadata', '__id', '__output', '__weak', '__reports')
 
-  def __init__(self, metadata = {}, output=False, **kwargs):
-    # TODO: ensure that name and dir are passed by the model
-    
-    # These should  be passed attributes from the Model instance
-    self.__dict__.update(kwargs)
-    self.__metadata = metadata
+  def __init__(self, model, metadata = {}, output=False, weak=False):
+    '''
+    Args:
+      model: The Model the run belongs to
+      metadata (dict): Metadata of the run, as read from its XML
+      output (optional bool): Default is False. Read the output now rather than on first use.
+      weak (optional bool): Default is False. Only hold the output while it is used elsewhere, reading it again after.
+    '''
+    self.model = model
+    self.__metadata = _intern_metadata(metadata)
 
-    self.__id = self.ProjectionId.split('.')[-1]
-    # Calling getOutput() takes a long time for asset projections, so pass a parameter specifying whether to do it
+    self.__id = self.id.split('.')[-1]
+    # Calling getOutput() takes a long time for asset projections, so output is otherwise only read on first use
+    self.__output = None
+    self.__weak = weak
+    self.__reports = None
     if output:
-      self.__output = self._getOutput()
-    else:
-      self.__output = None
-
-  def _getOutput(self):
-    # TODO: What happens when there are both TT and STT??
-      # ? Perhaps a dictionary of dataframe values with template as key?
-    # ! Use glob() here to get number of output files for Run
-    # Use run info to read in the output file
-    if os.path.exists(os.path.join(self.dir, '%s.Proj.%s.Run.%s.Rreq.006.Subtotal001.txt'%(self.name,self.id,self.id))):
-      return pd.read_csv(
-        os.path.join(self.dir, '%s.Proj.%s.Run.%s.Rreq.006.Subtotal001.txt'%(self.name,self.id,self.id))
-        , sep = '\t'
-      )
-    elif os.path.exists(os.path.join(self.dir, '%s.Proj.%s.Run.%s.Rreq.010.Total002.txt'%(self.name,self.id,self.id))):
-      return pd.read_csv(
-        os.path.join(self.dir, '%s.Proj.%s.Run.%s.Rreq.010.Total002.txt'%(self.name,self.id,self.id))
-        , sep = '\t'
-      )
-    else:
-      raise FileNotFoundError("Could not find output for %s.Proj.%s in '%s' ... Its possible that I am not yet equipped to read in the output your looking for."%(self.name, self.id, self.dir))
+      self.load_output()
+
+  def __getattr__(self, attr):
+    # Everything else comes from the model, as when runs were copies of it
+    if attr == 'model' or attr.startswith('__'):
+      raise AttributeError(attr)
+    return getattr(self.model, attr)
+
+  def __repr__(self):
+    return '<Run %s of %s>'%(self.__id, self.model.name)
+
+  @_instrumented('Run._getOutput')
+  def _getOutput(self, columns=None, dtype=None, cache=True):
+    reports = self.reports
+    return reports._read(Reports.key(_pick_output(reports, self.name, self.id, self.dir)), columns, dtype, cache)
+
+  def _getReports(self):
+    # Every report file of the run, from the model's listing
+    inv = self.inventory
+    return Reports([inv.path(f) for f in inv.reports.get(self.__id, [])])
+
+  def load_output(self, columns=None, dtype=None, cache=True):
+    '''Read the output of the run, keeping it as the output attribute
+
+    Args:
+      columns (optional list): Only keep these columns
+      dtype (optional): dict of column to dtype (e.g. {'Value': 'float32', 'Line': 'category'}), or 'float32' to downcast every float column
+      cache (optional bool): Default is True. Keep a binary copy of the parsed output next to the text file,
+        so it is only parsed again when the text file changes.
+
+    Returns:
+      DataFrame of the output
+    '''
+    output = self._getOutput(columns, dtype, cache)
+    self.__output = weakref.ref(output) if self.__weak else output
+    return output
+
+  async def aoutput(self, columns=None, dtype=None, cache=True, limit=None):
+    '''Async counterpart of load_output, reading the output without blocking the event loop
+
+    Args:
+      columns, dtype, cache (optional): As for load_output
+      limit (optional): Most blocking calls at once, as an int or an asyncio.Semaphore shared with other calls
+    '''
+    return await _blocking(_semaphore(limit), self.load_output, columns, dtype, cache)
 
   def _get_metadata(self, k):
     '''Gets the specified item from the metadata dictionary
@@ -375,13 +3170,15 @@ class Run(Model): # We want to pass some model methods
     else:
       raise IndexError('"%s" not in metadata'%k)
 
+  @_instrumented('Run._getLogs')
   def _getLogs(self):
     '''Get debug and grid logs'''
-    logs = glob.glob(os.path.join(self.dir, '%s.Run.%s.*.log'% (self.name, self.id)))
-    keys = [re.search('run\.\d+\.(.+)\.log', x.lower())[1] for x in logs] if logs else []
+    inv = self.inventory
     
-    # Return a dict with logName and fileName?
-    return dict(zip(keys, logs))
+    # Return a dict with logName and fileName
+    logs = {k: inv.path(f) for k, f in inv.logs.get(self.__id, {}).items()}
+    instrumentation.record(files=len(logs))
+    return logs
 
   @ property
   def metadata(self):
@@ -396,11 +3193,21 @@ class Run(Model): # We want to pass some model methods
   @property
   def output(self):
     '''View output from the run in tabular form
-    TODO: When it's currently none, set the attribute so file isn't read multiple times
 
+    The output is read on first use and kept, see load_output to choose columns and dtypes.
     '''    
-    return self.__output
+    output = self.__output() if self.__weak and self.__output is not None else self.__output
+    if output is None:
+      output = self.load_output()
+    return output
   
+  @property
+  def reports(self):
+    '''All report files of the run, as a mapping of key (e.g. '006.Subtotal001') to DataFrame, read on demand'''
+    if self.__reports is None:
+      self.__reports = self._getReports()
+    return self.__reports
+
   @property
   def description(self):
     return self._get_metadata('ProjectionDescription')
@@ -412,4 +3219,40 @@ class Run(Model): # We want to pass some model methods
   @property
   def logs(self):
     return self._getLogs()
+
+  def compare(self, other, keys=None, columns=None, tolerance=0.0, rel_tolerance=0.0):
+    '''Compare the output of this run against another run's
+
+    Args:
+      other: Run (or DataFrame of output) to compare against
+      keys (optional list): Columns identifying a row, e.g. ['Line', 'Period']. Default is every non-float column.
+      columns (optional list): Value columns to compare. Default is every numeric column that is not a key.
+      tolerance (optional float): Absolute differences up to this are not breaks
+      rel_tolerance (optional float): Differences up to this fraction of the value in this run are not breaks
+
+    Returns:
+      DataFrame of breaks, one row per key and column, with the value in each run, the difference
+      (other less this) and the relative difference. Rows present in only one run are breaks too.
+    '''
+    other = other.output if isinstance(other, Run) else other
+    return _compare_frames(self.output, other, keys, columns, tolerance, rel_tolerance)
+
+  def log(self, name):
+    '''A log of the run by name (e.g. 'debug'), see LogFile'''
+    logs = self._getLogs()
+    if name.lower() not in logs:
+      raise KeyError('No "%s" log for run %s. Available logs are: %s'%(name, self.id, ', '.join(logs)))
+    return LogFile(logs[name.lower()])
+
+  def search_logs(self, pattern, logs=None):
+    '''Find lines matching a regex in the logs of the run
+
+    Args:
+      pattern: Regex, as a str or bytes
+      logs (optional list): Names of the logs to search. Default is all of them. Logs the run does not have are skipped.
+
+    Returns:
+      DataFrame with the log, line number, byte offset and text of each matching line
+    '''
+    return _search_logs(self._getLogs(), pattern, logs)
     
@@ -0,0 +1,104 @@
+'''Benchmarks of pyalfa's hot paths on a synthetic model directory
+
+Records the best wall time and the peak (Python) memory of each benchmark, and can compare them against an
+earlier set of results to flag regressions.
+
+Examples:
+  Run at the default scale, keep the results and compare a later run against them::
+
+    python test/benchmarks.py --out before.json
+    python test/benchmarks.py --compare before.json
+'''
+import sys, os, json, time, argparse, tempfile, shutil, tracemalloc
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'pyalfa'))
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+from base import Model, Asset
+import synthetic
+
+def measure(fn, repeat=3):
+  '''Best wall time of fn over repeat calls, and its peak memory on the first call'''
+  tracemalloc.start()
+  fn()
+  peak = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+  times = []
+  for i in range(repeat):
+    start = time.perf_counter()
+    fn()
+    times.append(time.perf_counter() - start)
+  return {'seconds': min(times), 'peak_bytes': peak}
+
+def benchmarks(model_file, asset_data, out_dir):
+  '''The benchmarks, as a dict of name to function'''
+  m = Model(model_file)
+  first = m.runs[0]
+  asset = Asset('Bond', m)
+  asset.data = asset_data
+  asset.output_dest = out_dir
+  chunks = lambda: (asset_data.iloc[i:i + 10000] for i in range(0, len(asset_data), 10000))
+  return {
+    'model_discovery': lambda: Model(os.path.dirname(model_file)).refresh()
+    ,'model_runs_cached': lambda: m.runs
+    ,'run_metadata': lambda: m.run(first)
+    ,'runs_frame': lambda: m.runs_frame()
+    ,'run_output_parse': lambda: m.run(first).load_output(cache=False)
+    ,'run_output_cached': lambda: m.run(first).load_output()
+    ,'load_runs': lambda: m.load_runs()
+    ,'search_logs': lambda: m.search_logs('error')
+    ,'consolidate': lambda: m.consolidate(rebuild=True)
+    ,'store_load_line': lambda: m.consolidate().load(columns=['Period', 'Value'], where={'Line': 'Line001'})
+    ,'asset_validate': lambda: asset.validate()
+    ,'asset_format': lambda: asset.format()
+    ,'asset_build': lambda: asset.build()
+    ,'asset_build_stream': lambda: asset.build_stream(chunks())
+  }
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+  parser.add_argument('--runs', type=int, default=50, help='Runs in the synthetic model')
+  parser.add_argument('--periods', type=int, default=100, help='Projection periods per report')
+  parser.add_argument('--lines', type=int, default=50, help='Line items per report')
+  parser.add_argument('--log-lines', type=int, default=10000, help='Lines per log')
+  parser.add_argument('--asset-rows', type=int, default=100000, help='Rows of asset data')
+  parser.add_argument('--segments', type=int, default=50, help='Asset segments')
+  parser.add_argument('--repeat', type=int, default=3, help='Timed calls per benchmark')
+  parser.add_argument('--only', nargs='*', help='Benchmarks to run')
+  parser.add_argument('--out', help='Write the results to this JSON file')
+  parser.add_argument('--compare', help='JSON file of earlier results to compare against')
+  parser.add_argument('--threshold', type=float, default=1.2, help='Slowdown ratio reported as a regression')
+  args = parser.parse_args(argv)
+
+  root = tempfile.mkdtemp()
+  try:
+    model_file = synthetic.make_model(os.path.join(root, 'model'), runs=args.runs, periods=args.periods, lines=args.lines, log_lines=args.log_lines)
+    data = synthetic.make_asset_data(rows=args.asset_rows, segments=args.segments)
+    os.makedirs(os.path.join(root, 'out'))
+    results = {}
+    for name, fn in benchmarks(model_file, data, os.path.join(root, 'out')).items():
+      if args.only and name not in args.only:
+        continue
+      results[name] = measure(fn, args.repeat)
+      print('%-22s %10.4f s %12.1f MB'%(name, results[name]['seconds'], results[name]['peak_bytes'] / 2**20))
+  finally:
+    shutil.rmtree(root)
+
+  if args.out:
+    with open(args.out, 'w') as f:
+      json.dump({'args': vars(args), 'results': results}, f, indent=2)
+
+  regressions = []
+  if args.compare:
+    with open(args.compare) as f:
+      before = json.load(f)['results']
+    for name, r in results.items():
+      if name in before:
+        ratio = r['seconds'] / before[name]['seconds']
+        print('%-22s %6.2fx'%(name, ratio))
+        if ratio > args.threshold:
+          regressions.append(name)
+    if regressions:
+      print('Regressions: %s'%', '.join(regressions))
+  return 1 if regressions else 0
+
+if __name__=="__main__":
+  sys.exit(main())
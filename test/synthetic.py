@@ -0,0 +1,94 @@
+'''Generate synthetic ALFA model directories, at whatever scale is needed for testing or benchmarking'''
+import os, shutil, json
+import numpy as np
+import pandas as pd
+
+DEFS_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'files', 'AIA_Definitions.json')
+
+METADATA = '''<?xml version="1.0" encoding="utf-8"?>
+<RunMetadata>
+  <Item Type="ProjectionId">%(run)s</Item>
+  <Item Type="ProjectionDescription">%(desc)s</Item>
+  <Item Type="ValuationDate">%(valdate)s</Item>
+  <Item Type="Scenario" Key="Rates">%(rates)s</Item>
+  <Item Type="Scenario" Key="Equity">%(equity)s</Item>
+</RunMetadata>
+'''
+
+def make_output(periods=100, lines=50, rng=None):
+  '''One report of a run: a value per line item and period'''
+  rng = rng or np.random.default_rng()
+  return pd.DataFrame({
+    'Period': np.tile(np.arange(periods), lines)
+    ,'Line': np.repeat(['Line%03d'%i for i in range(lines)], periods)
+    ,'Value': rng.normal(100, 10, periods * lines).round(4)
+  })
+
+def make_log(path, lines=1000, rng=None):
+  '''A log with the occasional warning and error'''
+  rng = rng or np.random.default_rng()
+  kinds = rng.choice(['INFO: step completed', 'WARNING: slow convergence', 'ERROR: cell failed'], lines, p=[0.98, 0.015, 0.005])
+  with open(path, 'w') as f:
+    f.write('\n'.join('%s %d'%(kind, i) for i, kind in enumerate(kinds)))
+
+def make_asset_data(name='Bond', rows=10000, segments=20, defs_file=DEFS_FILE, seed=0):
+  '''Source data with every column the definitions of an asset type ask for'''
+  rng = np.random.default_rng(seed)
+  with open(defs_file) as f:
+    defs = sorted(json.load(f)[name].values(), key=lambda spec: spec['Index'])
+  df = pd.DataFrame({'segment': rng.integers(1, segments + 1, rows).astype(str)})
+  for spec in defs:
+    value = spec['Value']
+    if not (value.startswith('[') and value.endswith(']')) or value[1:-1] in df.columns:
+      continue
+    if spec['Format'] == 'Date':
+      df[value[1:-1]] = pd.Timestamp('2020-08-31') + pd.to_timedelta(rng.integers(-3650, 10950, rows), unit='D')
+    elif spec['Format'] in ('Integer', 'ZeroPad(2)', 'ZeroPad(3)'):
+      df[value[1:-1]] = rng.integers(0, 99, rows)
+    else:
+      df[value[1:-1]] = rng.normal(1000, 100, rows).round(2)
+  # The first field identifies the asset
+  df[defs[0]['Value'][1:-1]] = ['ID%09d'%i for i in range(rows)]
+  return df
+
+def make_model(model_dir, name='SynthModel', runs=10, reports=1, periods=100, lines=50, logs=('Debug', 'Grid'), log_lines=1000, tables=2, seed=0):
+  '''Create a model directory with runs, their metadata, reports and logs, and table files
+
+  Args:
+    model_dir (str): Directory to create the model in
+    name (str): Name of the model
+    runs (int): Number of runs
+    reports (int): Number of Subtotal reports per run (006.Subtotal001, 006.Subtotal002, ...)
+    periods, lines (int): Size of each report
+    logs (list): Logs to write for each run
+    log_lines (int): Lines in each log
+    tables (int): Number of (empty) table files
+
+  Returns:
+    Path to the model's \*.ain2 file
+  '''
+  rng = np.random.default_rng(seed)
+  os.makedirs(model_dir, exist_ok=True)
+  model_file = os.path.join(model_dir, '%s.ain2'%name)
+  open(model_file, 'a').close()
+  shutil.copy(DEFS_FILE, os.path.join(model_dir, 'AIA_Definitions.JSON'))
+  for i in range(tables):
+    open(os.path.join(model_dir, 'Table%02d.atb2x'%(i + 1)), 'a').close()
+
+  for r in range(1, runs + 1):
+    with open(os.path.join(model_dir, '%s.Run.%d.Metadata.xml'%(name, r)), 'w') as f:
+      f.write(METADATA%{
+        'run': r
+        ,'desc': 'Scenario %d'%r
+        ,'valdate': '08/31/2020' if r % 2 else '09/30/2020'
+        ,'rates': rng.choice(['Level', 'Up', 'Down'])
+        ,'equity': rng.choice(['Flat', 'Shock'])
+      })
+    for rep in range(1, reports + 1):
+      make_output(periods, lines, rng).to_csv(
+        os.path.join(model_dir, '%s.Proj.%d.Run.%d.Rreq.006.Subtotal%03d.txt'%(name, r, r, rep))
+        ,sep='\t', index=False
+      )
+    for log in logs:
+      make_log(os.path.join(model_dir, '%s.Run.%d.%s.log'%(name, r, log)), log_lines, rng)
+  return model_file
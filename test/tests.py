@@ -1,9 +1,12 @@
 import unittest
-import sys, shutil, os
+import sys, shutil, os, json, re, asyncio, subprocess
+import numpy as np
+import pandas as pd
 sys.path.append('../pyalfa')
 sys.path.append('..')
 sys.path.append('pyalfa')
-from base import Model, Asset
+from base import Model, Asset, Liability, Scenario, Inventory, LogFile, Portfolio, instrumentation
+import synthetic
 
 def create_dummy_model_folder(model_dir):
   # Create the model directory for testing
@@ -23,6 +26,10 @@ def create_dummy_model_folder(model_dir):
   open(os.path.join(model_dir, 'LiabInput01.ail2'), 'a').close()
   open(os.path.join(model_dir, 'LiabInput02.ail2'), 'a').close()
 
+  # Create the metadata and output of a couple of runs
+  for run, desc in [('1', 'Base'), ('2', 'Sensitivity')]:
+    create_dummy_run(model_dir, run, desc)
+
   # Create AIA definitions in model directory (copied from files)
   # Get this file's directory
   test_dir = os.path.dirname(os.path.realpath(__file__))
@@ -31,6 +38,45 @@ def create_dummy_model_folder(model_dir):
     ,os.path.join(model_dir, 'AIA_Definitions.json')
   )
 
+def create_dummy_run(model_dir, run, desc, valdate='08/31/2020', scale=1.0):
+  with open(os.path.join(model_dir, 'TestModel.Run.%s.Metadata.xml'%run), 'w') as f:
+    f.write('''<?xml version="1.0" encoding="utf-8"?>
+<RunMetadata>
+  <Item Type="ProjectionId">%s</Item>
+  <Item Type="ProjectionDescription">%s</Item>
+  <Item Type="ValuationDate">%s</Item>
+  <Item Type="Scenario" Key="Rates">Level</Item>
+  <Item Type="Scenario" Key="Equity">Flat</Item>
+</RunMetadata>
+'''%(run, desc, valdate))
+  output = pd.DataFrame({
+    'Period': [0, 1, 2] * 2
+    ,'Line': ['Reserve'] * 3 + ['Income'] * 3
+    ,'Value': [100.0, 101.5, 103.0, 5.0, 5.5, 6.0]
+  })
+  output['Value'] = output['Value'] * scale
+  output.to_csv(os.path.join(model_dir, 'TestModel.Proj.%s.Run.%s.Rreq.006.Subtotal001.txt'%(run, run)), sep='\t', index=False)
+  open(os.path.join(model_dir, 'TestModel.Run.%s.Debug.log'%run), 'a').close()
+
+def remove_dummy_run(model_dir, run):
+  for f in os.listdir(model_dir):
+    if '.Run.%s.'%run in f:
+      os.remove(os.path.join(model_dir, f))
+
+def dummy_bond_data(asset):
+  # Two rows of source data with every column the Bond definitions ask for
+  with open(asset.defs_file) as f:
+    defs = json.load(f)[asset.name]
+  sources = {v['Value'][1:-1] for v in defs.values() if v['Value'].startswith('[')}
+  df = pd.DataFrame({col: [1.0, 2.0] for col in sources})
+  df['segment'] = ['1', '2']
+  df['a_cusip_cd'] = ['A1', 'B2']
+  df['YTM'] = [7, 12.2]
+  df['a_naic_wt_nmbr'] = ['2', None]
+  for col in ['IssueDate', 'PaymentDate', 'BookMatDate', 'FirstCallDate', 'ParCallDate']:
+    df[col] = ['2020-08-31', '2019-01-15']
+  return df
+
 def clear_dummy_model_folder(model_dir):
   shutil.rmtree(model_dir)
 
@@ -99,6 +145,100 @@ class Test_Model_Attrs(unittest.TestCase):
     self.assertEqual(result.tables, [])
     open(os.path.join(result.dir, 'TableFile01.xlsx.atB2X'), 'a').close()
 
+  def test_table_data(self):
+    m = Model('FAKE_MODEL_DIR/TestModel.ain2')
+    files = {
+      'Lapse.atb2x': 'Duration\tRate\n1\t0.05\n2\t0.04\n'
+      ,'Mortality.atb2x': 'Age;Qx\n60;0.01\n61;0.011\n'
+      ,'Spread.atb2x': '<?xml version="1.0"?><Table><Row Rating="A"><Spread>0.01</Spread></Row><Row Rating="B"><Spread>0.02</Spread></Row></Table>'
+    }
+    for f, text in files.items():
+      with open(os.path.join(m.dir, f), 'w') as out:
+        out.write(text)
+    try:
+      tables = m.table_data
+      self.assertEqual(list(tables), ['Lapse', 'Mortality', 'Spread', 'TableFile01.xlsx'])
+      self.assertEqual(list(tables['Lapse']['Rate']), [0.05, 0.04])
+      self.assertIs(m.table_data['Lapse'], tables['Lapse'])
+      loaded, errors = tables.load(['Mortality', 'Spread'], workers=2)
+      self.assertEqual(errors, {})
+      self.assertEqual(list(loaded['Mortality'].columns), ['Age', 'Qx'])
+      self.assertEqual(list(loaded['Spread']['Rating']), ['A', 'B'])
+      self.assertEqual(list(loaded['Spread']['Spread']), [0.01, 0.02])
+      # Other models read the parsed tables from the cache
+      self.assertTrue(any(c.startswith('Lapse.atb2x') for c in os.listdir(os.path.join(m.dir, '.pyalfa'))))
+      pd.testing.assert_frame_equal(Model('FAKE_MODEL_DIR/TestModel.ain2').table_data['Mortality'], loaded['Mortality'])
+      # The empty TableFile01 fails on its own
+      loaded, errors = m.table_data.load()
+      self.assertEqual(sorted(loaded), ['Lapse', 'Mortality', 'Spread'])
+      self.assertEqual(list(errors), ['TableFile01.xlsx'])
+    finally:
+      for f in files:
+        os.remove(os.path.join(m.dir, f))
+    self.assertEqual(list(m.table_data), ['TableFile01.xlsx'])
+
+  def test_model_runs(self):
+    m = Model('FAKE_MODEL_DIR/TestModel.ain2')
+    self.assertEqual(m.runs, ['1', '2'])
+    self.assertIn('AssetInput02.aia2', m.inventory.assets)
+    self.assertIn('LiabInput02.ail2', m.inventory.liabilities)
+
+  def test_inventory_cached(self):
+    m = Model('FAKE_MODEL_DIR/TestModel.ain2')
+    inv = m.inventory
+    # Pretend the last scan was long after the directory last changed
+    inv.scanned += Inventory.racy
+    scanned = inv.scanned
+    self.assertIs(m.inventory, inv)
+    self.assertEqual(m.inventory.scanned, scanned)
+    self.assertNotEqual(m.refresh().scanned, scanned)
+
+  def test_inventory_persisted(self):
+    m = Model('FAKE_MODEL_DIR/TestModel.ain2', persist_inventory=True)
+    m.refresh()
+    self.assertTrue(os.path.exists(os.path.join('FAKE_MODEL_DIR', '.pyalfa', 'TestModel.inventory.json')))
+    other = Model('FAKE_MODEL_DIR/TestModel.ain2', persist_inventory=True)
+    self.assertEqual(other.runs, m.runs)
+
+  def test_runs_frame(self):
+    m = Model('FAKE_MODEL_DIR/TestModel.ain2')
+    df = m.runs_frame()
+    self.assertEqual(list(df.index), ['1', '2'])
+    self.assertEqual(list(df['ProjectionDescription']), ['Base', 'Sensitivity'])
+    self.assertEqual(list(df['Scenario.Rates']), ['Level', 'Level'])
+
+  def test_runs_frame_updates(self):
+    m = Model('FAKE_MODEL_DIR/TestModel.ain2')
+    m.runs_frame()
+    create_dummy_run('FAKE_MODEL_DIR', '3', 'Base Up 100', valdate='09/30/2020')
+    try:
+      self.assertEqual(list(m.runs_frame().index), ['1', '2', '3'])
+      self.assertEqual(list(m.query_runs(ValuationDate='09/30/2020').index), ['3'])
+      self.assertEqual(list(m.query_runs(ProjectionDescription=re.compile('^base', re.I)).index), ['1', '3'])
+      self.assertEqual(list(m.query_runs(where={'Scenario.Rates': ['Level']}).index), ['1', '2', '3'])
+    finally:
+      remove_dummy_run('FAKE_MODEL_DIR', '3')
+    self.assertEqual(list(m.runs_frame().index), ['1', '2'])
+
+  def test_runs_frame_broken_xml(self):
+    m = Model('FAKE_MODEL_DIR/TestModel.ain2')
+    create_dummy_run('FAKE_MODEL_DIR', '3', 'Half written')
+    path = os.path.join('FAKE_MODEL_DIR', 'TestModel.Run.3.Metadata.xml')
+    with open(path) as f:
+      xml = f.read()
+    with open(path, 'w') as f:
+      f.write(xml[:60])
+    try:
+      self.assertEqual(list(m.runs_frame().index), ['1', '2'])
+      parsed, errors = m._get_metadata_index().update(m.inventory)
+      self.assertEqual((parsed, list(errors)), ([], ['3']))
+      # Tried again once the XML is whole
+      with open(path, 'w') as f:
+        f.write(xml)
+      self.assertEqual(list(m.runs_frame().index), ['1', '2', '3'])
+    finally:
+      remove_dummy_run('FAKE_MODEL_DIR', '3')
+
   def test_model_output(self):
     pass
 
@@ -109,7 +249,27 @@ class Test_Model_Attrs(unittest.TestCase):
     pass
   
   def test_exclude_assets(self):
-    pass
+    m = Model('FAKE_MODEL_DIR/TestModel.ain2')
+    m.exclude('A1')
+    m.exclude([123, 'B2', 'A1'])
+    self.assertEqual(m.excluded, {'A1', 'B2', '123'})
+    with self.assertRaises(ValueError):
+      m.exclude(1.5)
+    m.exclude(np.int64(5))
+    m.exclude(pd.Series([7, None, 8.5]))
+    m.exclude({9})
+    self.assertEqual(m.excluded, {'A1', 'B2', '123', '5', '7', '8.5', '9'})
+    m.excluded = ['C3']
+    self.assertEqual(m.excluded, {'C3'})
+
+  def test_exclude_file(self):
+    m = Model('FAKE_MODEL_DIR/TestModel.ain2')
+    with open('FAKE_MODEL_DIR/excluded.txt', 'w') as f:
+      f.write('A1\nB2\n\n')
+    m.exclude_file('FAKE_MODEL_DIR/excluded.txt')
+    pd.DataFrame({'cusip': ['C3', None]}).to_csv('FAKE_MODEL_DIR/excluded.csv', index=False)
+    m.exclude_file('FAKE_MODEL_DIR/excluded.csv', column='cusip')
+    self.assertEqual(m.excluded, {'A1', 'B2', 'C3'})
 
 class Test_AIA_init(unittest.TestCase):
   def test_AIA_fine(self):
@@ -145,10 +305,176 @@ class Test_AIA_attrs(unittest.TestCase):
     pass
 
   def test_build_without_data(self):
-    pass
+    result = Asset('Bond', Model('FAKE_MODEL_DIR/TestModel.ain2'))
+    with self.assertRaises(ValueError):
+      result.build()
 
   def test_build_good(self):
-    pass
+    result = Asset('Bond')
+    result.output_dest = 'FAKE_MODEL_DIR'
+    result.data = pd.DataFrame({'segment': [1, 2, 1, 3], 'cusip': ['A', 'B', 'C', 'D']})
+    manifest = result.build(workers=2)
+    self.assertEqual(list(manifest['segment']), ['1', '2', '3'])
+    self.assertEqual(list(manifest['rows']), [2, 1, 1])
+    with open(os.path.join('FAKE_MODEL_DIR', '1_Bond.aia2')) as f:
+      self.assertEqual(f.read().split(), ['1', 'A', '1', 'C'])
+    self.assertEqual(manifest['bytes'][0], os.path.getsize(os.path.join('FAKE_MODEL_DIR', '1_Bond.aia2')))
+
+  def test_build_single_file(self):
+    result = Asset('Bond')
+    result.output_dest = 'FAKE_MODEL_DIR'
+    result.data = pd.DataFrame({'segment': ['1', '2', '1', '3'], 'cusip': ['A', 'B', 'C', 'D']})
+    result.outfile_name = 'AllBonds.aia2'
+    manifest = result.build(['1', '3'])
+    self.assertEqual(list(manifest['rows']), [3])
+
+  def test_format_with_definitions(self):
+    result = Asset('Bond', Model('FAKE_MODEL_DIR/TestModel.ain2'))
+    result.data = dummy_bond_data(result)
+    layout = result.format()
+    self.assertEqual(list(layout.columns), result.fields)
+    self.assertEqual(list(layout['ck.YrsToMat']), ['007', '012'])
+    self.assertEqual(list(layout['ck.QualRating']), ['2', ''])
+    self.assertEqual(list(layout['IssueDate']), ['08/31/2020', '01/15/2019'])
+    self.assertEqual(list(layout['ck.GAAPCat']), ['_', '_'])
+    self.assertEqual(list(layout['ck.Cusip']), ['A1', 'B2'])
+
+  def test_validate(self):
+    result = Asset('Bond', Model('FAKE_MODEL_DIR/TestModel.ain2'))
+    data = pd.concat([dummy_bond_data(result)] * 2, ignore_index=True)
+    data['YTM'] = [7, 12, 1000, -1]
+    data['AssetGroup'] = ['1', 'x', '2', ' ']
+    data['IssueDate'] = ['2020-08-31', 'not a date', None, '2020-09-30']
+    data['a_cusip_cd'] = ['A1', 'B\t2', 'C3', 'D4']
+    result.data = data
+    errors = result.validate()
+    self.assertEqual(list(errors.columns), ['row', 'field', 'rule', 'value'])
+    self.assertEqual(list(zip(errors['row'], errors['field'], errors['rule'])), [
+      (1, 'ck.Cusip', 'delimiter')
+      ,(1, 'ck.AssetGroup', 'integer')
+      ,(1, 'IssueDate', 'date')
+      ,(2, 'ck.YrsToMat', 'zeropad')
+      ,(3, 'ck.YrsToMat', 'zeropad')
+    ])
+    self.assertEqual(errors['value'][2], 'not a date')
+    self.assertEqual(len(result.validate(dummy_bond_data(result).assign(YTM=[7, 12]))), 0)
+    errors = result.validate(data.drop(columns=['AVR']))
+    self.assertEqual(list(errors.iloc[0][['field', 'rule', 'value']]), ['ck.AVRCat', 'missing column', 'AVR'])
+    self.assertTrue(pd.isna(errors['row'][0]))
+    result.outfile_name = 'SEGNUMBER_Invalid.aia2'
+    with self.assertRaises(ValueError):
+      result.build(validate=True)
+    self.assertFalse(os.path.exists(os.path.join('FAKE_MODEL_DIR', '1_Invalid.aia2')))
+
+  def test_format_mixed_dates(self):
+    result = Asset('Bond', Model('FAKE_MODEL_DIR/TestModel.ain2'))
+    data = dummy_bond_data(result).assign(IssueDate=['2020-08-31', '08/31/2020'])
+    formatted = result.format(data)
+    self.assertEqual(list(formatted['IssueDate']), ['08/31/2020', '08/31/2020'])
+    with self.assertRaises(ValueError):
+      result.format(data.assign(IssueDate=['2020-08-31', 'not a date']))
+    self.assertEqual(list(result.format(data.assign(IssueDate=['2020-08-31', ' ']))['IssueDate'].fillna('')), ['08/31/2020', ''])
+
+  def test_build_formats_requested_segments(self):
+    result = Asset('Bond', Model('FAKE_MODEL_DIR/TestModel.ain2'))
+    result.data = dummy_bond_data(result).assign(IssueDate=['2020-08-31', 'not a date'])
+    result.outfile_name = 'SEGNUMBER_Requested.aia2'
+    # Segment 2 would fail to format, but is not built
+    self.assertEqual(list(result.build(['1'])['rows']), [1])
+    with self.assertRaises(ValueError):
+      result.build(['2'])
+
+  def test_build_validates_requested_segments(self):
+    result = Asset('Bond', Model('FAKE_MODEL_DIR/TestModel.ain2'))
+    result.data = dummy_bond_data(result).assign(IssueDate=['2020-08-31', 'not a date'])
+    result.outfile_name = 'SEGNUMBER_Requested.aia2'
+    manifest = result.build(['1'], validate=True)
+    self.assertEqual(list(manifest['rows']), [1])
+    with self.assertRaises(ValueError):
+      result.build(['2'], validate=True)
+
+  def test_format_missing_columns(self):
+    result = Asset('Bond', Model('FAKE_MODEL_DIR/TestModel.ain2'))
+    with self.assertRaises(KeyError):
+      result.format(pd.DataFrame({'segment': [1]}))
+
+  def test_build_stream_matches_build(self):
+    result = Asset('Bond', Model('FAKE_MODEL_DIR/TestModel.ain2'))
+    data = pd.concat([dummy_bond_data(result)] * 5, ignore_index=True)
+    data['segment'] = ['1', '2', '3', '1', '2'] * 2
+    result.data = data
+    result.outfile_name = 'SEGNUMBER_InMemory.aia2'
+    result.build()
+    result.outfile_name = 'SEGNUMBER_Streamed.aia2'
+    manifest = result.build_stream((data.iloc[i:i+3] for i in range(0, len(data), 3)), segs=['1', '2', '3', '4'])
+    self.assertEqual(list(manifest['rows']), [4, 4, 2, 0])
+    for seg in ['1', '2', '3']:
+      with open(os.path.join('FAKE_MODEL_DIR', '%s_InMemory.aia2'%seg), 'rb') as a, open(os.path.join('FAKE_MODEL_DIR', '%s_Streamed.aia2'%seg), 'rb') as b:
+        self.assertEqual(a.read(), b.read())
+
+  def test_build_excluded(self):
+    m = Model('FAKE_MODEL_DIR/TestModel.ain2')
+    result = Asset('Bond', m)
+    data = dummy_bond_data(result)
+    result.data = data
+    result.outfile_name = 'SEGNUMBER_Excluded.aia2'
+    m.exclude('A1')
+    manifest = result.build(['1', '2'])
+    self.assertEqual(list(manifest['rows']), [0, 1])
+    self.assertEqual(list(manifest['excluded']), [1, 0])
+    manifest = result.build_stream((data.iloc[[i]] for i in range(len(data))))
+    self.assertEqual(list(manifest['segment']), ['1', '2'])
+    self.assertEqual(list(manifest['excluded']), [1, 0])
+
+  def test_build_incremental(self):
+    m = Model('FAKE_MODEL_DIR/TestModel.ain2')
+    result = Asset('Bond', m)
+    data = pd.concat([dummy_bond_data(result)] * 3, ignore_index=True)
+    data['segment'] = ['1', '2', '3', '1', '2', '3']
+    result.data = data
+    result.outfile_name = 'SEGNUMBER_Incremental.aia2'
+    manifest = result.build(incremental=True)
+    self.assertEqual(list(manifest['written']), [True, True, True])
+    self.assertEqual(list(result.build(incremental=True)['written']), [False, False, False])
+    # Only the segment whose rows changed is written again
+    data.loc[4, 'YTM'] = 20
+    rebuilt = result.build(incremental=True)
+    self.assertEqual(list(rebuilt['written']), [False, True, False])
+    pd.testing.assert_frame_equal(rebuilt.drop(columns='written'), result.build().drop(columns='written'))
+    # As is a file changed since, and every file when the formats change
+    with open(os.path.join('FAKE_MODEL_DIR', '3_Incremental.aia2'), 'a') as f:
+      f.write('extra')
+    self.assertEqual(list(result.build(incremental=True)['written']), [False, False, True])
+    result.date_format = '%Y-%m-%d'
+    self.assertEqual(list(result.build(['1', '2'], incremental=True)['written']), [True, True])
+    m.exclude('B2')
+    rebuilt = result.build(['2', '3'], incremental=True)
+    self.assertEqual(list(rebuilt['written']), [True, True])
+    self.assertEqual(list(rebuilt['excluded']), [1, 1])
+
+  def test_build_stream_csv(self):
+    result = Asset('Bond')
+    result.output_dest = 'FAKE_MODEL_DIR'
+    pd.DataFrame({'segment': [1, 2, 1, 3], 'cusip': ['A', 'B', 'C', 'D']}).to_csv('FAKE_MODEL_DIR/source.csv', index=False)
+    manifest = result.build_stream('FAKE_MODEL_DIR/source.csv', chunksize=2)
+    self.assertEqual(list(manifest['segment']), ['1', '2', '3'])
+    self.assertEqual(list(manifest['rows']), [2, 1, 1])
+
+  def test_build_stream_csv_late_blank(self):
+    result = Asset('Bond')
+    result.output_dest = 'FAKE_MODEL_DIR'
+    source = os.path.join('FAKE_MODEL_DIR', 'late_blank.csv')
+    pd.DataFrame({'segment': [1, 2, 1, 2, 1, 2], 'par': [1, 2, 3, 4, None, 6], 'rate': [0.5, 1.5, 2.0, 1.0, 3.25, 4.0]}).to_csv(source, index=False)
+    result.data = pd.read_csv(source)
+    result.outfile_name = 'SEGNUMBER_Whole.aia2'
+    result.build()
+    result.outfile_name = 'SEGNUMBER_Chunked.aia2'
+    result.build_stream(source, chunksize=2)
+    for seg in ['1', '2']:
+      with open(os.path.join('FAKE_MODEL_DIR', '%s_Whole.aia2'%seg), 'rb') as a, open(os.path.join('FAKE_MODEL_DIR', '%s_Chunked.aia2'%seg), 'rb') as b:
+        self.assertEqual(a.read(), b.read())
+    with open(os.path.join('FAKE_MODEL_DIR', '2_Whole.aia2')) as f:
+      self.assertEqual(f.read().split('\n')[1], '2\t4\t1')
 
   def test_build_empty_data(self):
     pass
@@ -156,11 +482,519 @@ class Test_AIA_attrs(unittest.TestCase):
   def test_build_without_definitions_file(self):
     pass
 
+class Test_Synthetic(unittest.TestCase):
+  def test_synthetic_model(self):
+    model_file = synthetic.make_model(os.path.join('FAKE_MODEL_DIR', 'synthetic'), runs=3, reports=2, periods=4, lines=2, log_lines=10)
+    m = Model(model_file)
+    self.assertEqual(m.runs, ['1', '2', '3'])
+    self.assertEqual(sorted(m.run('2').reports), ['006.Subtotal001', '006.Subtotal002'])
+    self.assertEqual(m.run('3').output.shape, (8, 3))
+    self.assertEqual(sorted(m.run('1').logs), ['debug', 'grid'])
+
+  def test_synthetic_assets(self):
+    result = Asset('Bond', Model(synthetic.make_model(os.path.join('FAKE_MODEL_DIR', 'synthetic'), runs=0)))
+    result.data = synthetic.make_asset_data(rows=50, segments=3)
+    manifest = result.build()
+    self.assertEqual(manifest['rows'].sum(), 50)
+
 class Test_AIL_init(unittest.TestCase):
-  pass
+  def test_AIL_fine(self):
+    result = Liability('Annuity')
+    self.assertIsInstance(result, Liability)
+    self.assertEqual(result.outfile_name, 'SEGNUMBER_Annuity.ail2')
+
+  def test_AIL_badModel(self):
+    with self.assertRaises(ValueError):
+      result = Liability('Annuity', 'string')
+
+  def test_AIL_build_by_plan(self):
+    m = Model('FAKE_MODEL_DIR/TestModel.ain2')
+    with open(os.path.join(m.dir, 'AIL_Definitions.JSON'), 'w') as f:
+      json.dump({'Annuity': {
+        'PolicyId': {'Value': '[policy]', 'Index': 0, 'Format': 'None'}
+        ,'PlanCode': {'Value': '[plan]', 'Index': 1, 'Format': 'ZeroPad(3)'}
+        ,'IssueDate': {'Value': '[issued]', 'Index': 2, 'Format': 'Date'}
+        ,'Count': {'Value': '1', 'Index': 3, 'Format': 'Integer'}
+      }}, f)
+    try:
+      result = Liability('Annuity', m)
+      result.segment_column = 'plan'
+      # Exclusions are for assets only
+      m.exclude('P1')
+      data = pd.DataFrame({'policy': ['P1', 'P2', 'P3'], 'plan': [7, 12, 7], 'issued': ['2001-02-03'] * 3})
+      manifest = result.build_stream((data.iloc[[i]] for i in range(3)), workers=2)
+      self.assertEqual(list(manifest['segment']), ['7', '12'])
+      self.assertEqual(list(manifest['rows']), [2, 1])
+      with open(os.path.join(m.dir, '7_Annuity.ail2')) as f:
+        self.assertEqual(f.read().splitlines(), ['P1\t007\t02/03/2001\t1', 'P3\t007\t02/03/2001\t1'])
+    finally:
+      os.remove(os.path.join(m.dir, 'AIL_Definitions.JSON'))
+
+class Test_Scenario(unittest.TestCase):
+  def test_scenario_build(self):
+    paths = np.arange(2 * 3 * 2, dtype=float).reshape(2, 3, 2) / 100
+    result = Scenario(paths, ['Treasury', 'Equity'], Model('FAKE_MODEL_DIR/TestModel.ain2'))
+    manifest = result.build(workers=2, batch=1)
+    self.assertEqual(list(manifest['scenario']), [1, 2])
+    with open(os.path.join('FAKE_MODEL_DIR', 'Scenario_2.agu')) as f:
+      lines = f.read().splitlines()
+    self.assertEqual(lines[0], 'Period\tTreasury\tEquity')
+    self.assertEqual(lines[1:], ['0\t0.060000\t0.070000', '1\t0.080000\t0.090000', '2\t0.100000\t0.110000'])
+    self.assertEqual(manifest['bytes'][1], os.path.getsize(os.path.join('FAKE_MODEL_DIR', 'Scenario_2.agu')))
+
+  def test_scenario_memory_mapped(self):
+    paths = np.random.default_rng(0).normal(size=(12, 5, 1))
+    np.save(os.path.join('FAKE_MODEL_DIR', 'paths.npy'), paths)
+    result = Scenario(os.path.join('FAKE_MODEL_DIR', 'paths.npy'))
+    self.assertIsInstance(result.paths, np.memmap)
+    result.output_dest = 'FAKE_MODEL_DIR'
+    result.outfile_name = 'Mapped_SCENNUMBER.agu'
+    manifest = result.build([3, 12], executor='process')
+    self.assertEqual(list(manifest['file']), [os.path.join('FAKE_MODEL_DIR', 'Mapped_03.agu'), os.path.join('FAKE_MODEL_DIR', 'Mapped_12.agu')])
+    written = pd.read_csv(manifest['file'][1], sep='\t')
+    np.testing.assert_allclose(written['Curve1'], paths[11, :, 0], atol=1e-6)
+    with self.assertRaises(ValueError):
+      result.build([13])
 
 class Test_Output_init(unittest.TestCase):
-  pass
+  def test_run_metadata(self):
+    r = Model('FAKE_MODEL_DIR/TestModel.ain2').run('1')
+    self.assertEqual(r.id, '1')
+    self.assertEqual(r.description, 'Base')
+    self.assertEqual(r.metadata['Scenario'], {'Rates': 'Level', 'Equity': 'Flat'})
+
+  def test_run_shares_model(self):
+    m = Model('FAKE_MODEL_DIR/TestModel.ain2')
+    r = m.run('1')
+    self.assertIs(r.model, m)
+    self.assertFalse(hasattr(r, '__dict__'))
+    self.assertEqual((r.dir, r.name, r.runs), (m.dir, m.name, ['1', '2']))
+    self.assertIs(r.valdate, m.run('2').valdate)
+
+  def test_run_set(self):
+    m = Model('FAKE_MODEL_DIR/TestModel.ain2')
+    runs = m.run_set()
+    self.assertEqual(list(runs), ['1', '2'])
+    self.assertIn('2', runs)
+    self.assertNotIn('3', runs)
+    self.assertEqual(str(runs.metadata['Scenario.Rates'].dtype), 'category')
+    self.assertEqual(runs['2'].metadata, m.run('2').metadata)
+    self.assertEqual(list(runs.query(ProjectionDescription='Base')), ['1'])
+    self.assertEqual(list(m.run_set(['2']).load()[0]['run'].unique()), ['2'])
+    with self.assertRaises(KeyError):
+      runs['3']
+    # Ids and ProjectionIds are kept as listed
+    create_dummy_run('FAKE_MODEL_DIR', '007', 'Padded')
+    create_dummy_run('FAKE_MODEL_DIR', '8', 'Qualified')
+    path = os.path.join('FAKE_MODEL_DIR', 'TestModel.Run.8.Metadata.xml')
+    with open(path) as f:
+      xml = f.read().replace('>8<', '>TestModel.Proj.8<')
+    with open(path, 'w') as f:
+      f.write(xml)
+    try:
+      more = m.run_set()
+      self.assertEqual(list(more), ['1', '2', '007', '8'])
+      self.assertEqual(len(more['007'].load_output()), 6)
+      self.assertEqual(more['8'].metadata, m.run('8').metadata)
+      self.assertEqual(more['8'].id, 'TestModel.Proj.8')
+    finally:
+      remove_dummy_run('FAKE_MODEL_DIR', '007')
+      remove_dummy_run('FAKE_MODEL_DIR', '8')
+    # Runs of a set only hold their output while it is used
+    r = runs['1']
+    output = r.output
+    self.assertIs(r.output, output)
+    del output
+    self.assertEqual(r.output.shape, (6, 3))
+
+  def test_output_lazy(self):
+    r = Model('FAKE_MODEL_DIR/TestModel.ain2').run('1')
+    self.assertEqual(r.output.shape, (6, 3))
+    self.assertIs(r.output, r.output)
+
+  def test_output_typed(self):
+    r = Model('FAKE_MODEL_DIR/TestModel.ain2').run('1')
+    df = r.load_output(columns=['Line', 'Value'], dtype={'Value': 'float32', 'Line': 'category'})
+    self.assertEqual(list(df.columns), ['Line', 'Value'])
+    self.assertEqual(str(df['Value'].dtype), 'float32')
+    self.assertEqual(str(df['Line'].dtype), 'category')
+    self.assertIs(r.output, df)
+
+  def test_output_cache(self):
+    r = Model('FAKE_MODEL_DIR/TestModel.ain2').run('1')
+    r.load_output()
+    caches = os.listdir(os.path.join('FAKE_MODEL_DIR', '.pyalfa'))
+    self.assertEqual(len([c for c in caches if c.startswith('TestModel.Proj.1.Run.1.Rreq.006')]), 1)
+    pd.testing.assert_frame_equal(r.load_output(), r.load_output(cache=False))
+    # A cache replaced by a pickle is never unpickled, the output is parsed again instead
+    cache = os.path.join('FAKE_MODEL_DIR', '.pyalfa', [c for c in caches if c.startswith('TestModel.Proj.1.Run.1.Rreq.006')][0])
+    pd.to_pickle(pd.DataFrame({'planted': [1]}), cache)
+    self.assertEqual(list(r.load_output().columns), ['Period', 'Line', 'Value'])
+
+  def test_run_logs(self):
+    r = Model('FAKE_MODEL_DIR/TestModel.ain2').run('1')
+    self.assertEqual(r.logs, {'debug': os.path.join('FAKE_MODEL_DIR', 'TestModel.Run.1.Debug.log')})
+
+  def test_compare(self):
+    m = Model('FAKE_MODEL_DIR/TestModel.ain2')
+    base = m.run('1')
+    self.assertEqual(len(base.compare(m.run('2'))), 0)
+    other = base.output.iloc[::-1].copy()
+    other.loc[other['Period'] == 2, 'Value'] += [0.001, 0.5]
+    other = other.loc[~((other['Line'] == 'Income') & (other['Period'] == 0))]
+    breaks = base.compare(other, keys=['Line', 'Period'], tolerance=0.01)
+    self.assertEqual(list(zip(breaks['Line'], breaks['Period'])), [('Reserve', 2), ('Income', 0)])
+    self.assertEqual(list(breaks['diff'][:1]), [0.5])
+    self.assertTrue(pd.isna(breaks['other'][1]))
+    self.assertEqual(len(base.compare(other, keys=['Line', 'Period'], rel_tolerance=0.01)), 1)
+    with self.assertRaises(ValueError):
+      base.compare(other, keys=['Line'])
+
+  def test_summarize_runs(self):
+    m = Model('FAKE_MODEL_DIR/TestModel.ain2')
+    for run, scale in [('3', 2.0), ('4', 3.0), ('5', 0.5)]:
+      create_dummy_run('FAKE_MODEL_DIR', run, 'Stochastic', scale=scale)
+    try:
+      ids = ['1', '2', '3', '4', '5']
+      stats = m.summarize_runs(ids, keys=['Line', 'Period'], percentiles=[0.5], cte=[0.6], sample='all', workers=2)
+      # Runs within the default memory give exact results too
+      pd.testing.assert_frame_equal(m.summarize_runs(ids, keys=['Line', 'Period'], percentiles=[0.5], cte=[0.6], executor='thread'), stats)
+      df, errors = m.load_runs(ids)
+      expected = df.groupby(['Line', 'Period'])['Value']
+      pd.testing.assert_series_equal(stats[('Value', 'mean')], expected.mean(), check_names=False)
+      pd.testing.assert_series_equal(stats[('Value', 'std')], expected.std(), check_names=False)
+      pd.testing.assert_series_equal(stats[('Value', 'p50')], expected.median(), check_names=False)
+      # Top 40% of five runs are those scaled by 2 and 3
+      self.assertEqual(stats.loc[('Reserve', 0), ('Value', 'cte60')], 250.0)
+      sampled = m.summarize_runs(ids, keys=['Line', 'Period'], sample=3, executor='thread', seed=1)
+      pd.testing.assert_series_equal(sampled[('Value', 'max')], expected.max(), check_names=False)
+      # Room for the values of two runs (six cells of 8 bytes each)
+      bounded = m.summarize_runs(ids, keys=['Line', 'Period'], memory=96, workers=1, executor='thread', seed=1)
+      pd.testing.assert_series_equal(bounded[('Value', 'mean')], expected.mean(), check_names=False)
+      self.assertTrue(bounded[('Value', 'p50')].notna().all())
+    finally:
+      for run in ['3', '4', '5']:
+        remove_dummy_run('FAKE_MODEL_DIR', run)
+
+  def test_log_search(self):
+    m = Model('FAKE_MODEL_DIR/TestModel.ain2')
+    with open(os.path.join(m.dir, 'TestModel.Run.2.Grid.log'), 'w') as f:
+      f.write('Starting run\nWARNING: cell 4 slow\nstep 1\nERROR: cell 7 failed\nError again, same cell 7\nDone')
+    try:
+      log = m.run('2').log('Grid')
+      self.assertEqual(list(log.index()['level']), ['warning', 'error', 'error'])
+      self.assertEqual(list(log.errors['line']), [4, 5])
+      self.assertEqual(list(log.search('cell 7')['text']), ['ERROR: cell 7 failed', 'Error again, same cell 7'])
+      self.assertEqual(log.tail(2, blocksize=8), ['Error again, same cell 7', 'Done'])
+      with open(log.path, 'a') as f:
+        f.write('\n' + 'step\n' * 300000 + 'ERROR: at the end')
+      self.assertEqual(list(log.search('at the end')['line']), [300007])
+      found = m.search_logs(r'cell \d', workers=2)
+      self.assertEqual(list(found['run']), ['2', '2', '2'])
+      self.assertEqual(list(found['log']), ['grid'] * 3)
+      pd.testing.assert_frame_equal(m.search_logs(r'cell \d', workers=2, executor='thread'), found)
+      self.assertEqual(len(m.search_logs('cell', logs=['debug'])), 0)
+    finally:
+      os.remove(os.path.join(m.dir, 'TestModel.Run.2.Grid.log'))
+
+  def test_log_follow(self):
+    path = os.path.join('FAKE_MODEL_DIR', 'follow.log')
+    open(path, 'w').close()
+    lines = LogFile(path).follow(interval=0.01, timeout=0.1)
+    with open(path, 'a') as f:
+      f.write('first\n')
+    self.assertEqual(next(lines), 'first')
+    self.assertEqual(list(lines), [])
+
+  def test_instrumentation(self):
+    seen = []
+    instrumentation.enable()
+    instrumentation.add_hook(seen.append)
+    try:
+      m = Model('FAKE_MODEL_DIR/TestModel.ain2')
+      m.runs
+      r = m.run('1')
+      r.load_output(cache=False)
+      r.logs
+    finally:
+      instrumentation.disable()
+      instrumentation.remove_hook(seen.append)
+    stats = instrumentation.stats()
+    instrumentation.reset()
+    self.assertEqual(list(stats.index), ['Model._get_runs', 'Model.run', 'Run._getLogs', 'Run._getOutput'])
+    self.assertEqual(stats.loc['Run._getOutput', 'rows'], 6)
+    self.assertGreater(stats.loc['Run._getOutput', 'bytes_read'], 0)
+    self.assertEqual(stats.loc['Run._getLogs', 'calls'], 1)
+    self.assertEqual(len(seen), stats['calls'].sum())
+    Model('FAKE_MODEL_DIR/TestModel.ain2').runs
+    self.assertEqual(instrumentation.records, [])
+
+  def test_instrumentation_names_and_hooks(self):
+    def broken(rec):
+      raise RuntimeError('hook failed')
+    instrumentation.enable()
+    instrumentation.add_hook(broken)
+    try:
+      liability = Liability('Annuity')
+      liability.output_dest = 'FAKE_MODEL_DIR'
+      liability.data = pd.DataFrame({'segment': [1], 'policy': ['P1']})
+      with self.assertWarns(RuntimeWarning):
+        manifest = liability.build()
+      with self.assertWarns(RuntimeWarning), self.assertRaises(ValueError):
+        Model('FAKE_MODEL_DIR/TestModel.ain2').run('9')
+    finally:
+      instrumentation.disable()
+      instrumentation.remove_hook(broken)
+    stats = instrumentation.stats()
+    instrumentation.reset()
+    # The hook's error neither replaced the result nor the error raised
+    self.assertEqual(list(manifest['rows']), [1])
+    self.assertIn('Liability.build', stats.index)
+    self.assertNotIn('Asset.build', stats.index)
+
+  def test_watch_check(self):
+    m = Model('FAKE_MODEL_DIR/TestModel.ain2')
+    w = m.watch()
+    self.assertEqual(w.check(), [])
+    lock = os.path.join(m.dir, 'TestModel.ain2.lock')
+    open(lock, 'a').close()
+    try:
+      create_dummy_run('FAKE_MODEL_DIR', '3', 'Late', scale=2.0)
+      self.assertEqual(w.check(), [])
+    finally:
+      os.remove(lock)
+    try:
+      events = w.check()
+      self.assertEqual([(e['event'], e['id']) for e in events], [('completed', '3')])
+      self.assertEqual(events[0]['run'].description, 'Late')
+      self.assertEqual(events[0]['run'].output['Value'].sum(), 2 * m.run('1').output['Value'].sum())
+      self.assertIn('3', m.runs_frame().index)
+    finally:
+      remove_dummy_run('FAKE_MODEL_DIR', '3')
+    self.assertEqual([(e['event'], e['id']) for e in w.check()], [('removed', '3')])
+    # A broken XML holds back only its own run
+    create_dummy_run('FAKE_MODEL_DIR', '4', 'Broken')
+    create_dummy_run('FAKE_MODEL_DIR', '5', 'Good')
+    with open(os.path.join('FAKE_MODEL_DIR', 'TestModel.Run.4.Metadata.xml'), 'w') as f:
+      f.write('<?xml version="1.0"?><RunMetadata><Item')
+    try:
+      self.assertEqual([(e['event'], e['id']) for e in w.check()], [('completed', '5')])
+      self.assertEqual(w.check(), [])
+      create_dummy_run('FAKE_MODEL_DIR', '4', 'Fixed')
+      self.assertEqual([(e['event'], e['id'], e['run'].description) for e in w.check()], [('completed', '4', 'Fixed')])
+    finally:
+      remove_dummy_run('FAKE_MODEL_DIR', '4')
+      remove_dummy_run('FAKE_MODEL_DIR', '5')
+    w.check()
+    self.assertEqual(len(m.watch(existing=True, output=False).check()), 2)
+
+  def test_watch_without_inotify(self):
+    w = Model('FAKE_MODEL_DIR/TestModel.ain2').watch()
+    platform = sys.platform
+    sys.platform = 'win32'
+    try:
+      # Falls back to checking every interval
+      self.assertIsNone(w._open_inotify())
+    finally:
+      sys.platform = platform
+
+  def test_watch_async(self):
+    m = Model('FAKE_MODEL_DIR/TestModel.ain2')
+    async def first(watcher):
+      async for e in watcher:
+        return e
+    async def watch():
+      task = asyncio.ensure_future(first(m.watch(interval=0.05)))
+      await asyncio.sleep(0.1)
+      create_dummy_run('FAKE_MODEL_DIR', '3', 'Late')
+      return await asyncio.wait_for(task, 5)
+    loop = asyncio.new_event_loop()
+    try:
+      e = loop.run_until_complete(watch())
+    finally:
+      loop.close()
+      remove_dummy_run('FAKE_MODEL_DIR', '3')
+    self.assertEqual((e['event'], e['id'], e['error']), ('completed', '3', None))
+
+  def test_load_runs(self):
+    m = Model('FAKE_MODEL_DIR/TestModel.ain2')
+    df, errors = m.load_runs(['1', '2', '3'], workers=2, columns=['Line', 'Value'])
+    self.assertEqual(list(df.columns), ['run', 'Line', 'Value'])
+    self.assertEqual(list(df['run'].unique()), ['1', '2'])
+    self.assertEqual(list(errors.keys()), ['3'])
+    self.assertIsInstance(errors['3'], ValueError)
+    instrumentation.enable()
+    try:
+      m.load_runs(executor='process')
+      m.search_logs('cell')
+    finally:
+      instrumentation.disable()
+    stats = instrumentation.stats()
+    instrumentation.reset()
+    # Read from the model's listing, without parsing each run's metadata
+    self.assertNotIn('Model.run', stats.index)
+
+  def test_async(self):
+    m = Model('FAKE_MODEL_DIR/TestModel.ain2')
+    async def load():
+      limit = asyncio.Semaphore(2)
+      runs = await m.aruns(limit)
+      run = await m.arun('2', limit)
+      output = await run.aoutput(columns=['Value'], limit=limit)
+      loaded = await asyncio.gather(m.aload_runs(['1', '2', '3'], limit=limit), m.aload_runs(concat=False))
+      return runs, run, output, loaded
+    loop = asyncio.new_event_loop()
+    try:
+      runs, run, output, loaded = loop.run_until_complete(load())
+    finally:
+      loop.close()
+    self.assertEqual(runs, ['1', '2'])
+    self.assertEqual(run.description, 'Sensitivity')
+    self.assertIs(run.output, output)
+    (df, errors), (frames, none) = loaded
+    expected, _ = m.load_runs(['1', '2'])
+    pd.testing.assert_frame_equal(df, expected)
+    self.assertEqual(list(errors.keys()), ['3'])
+    self.assertEqual(sorted(frames.keys()), ['1', '2'])
+    self.assertEqual(none, {})
+
+  def test_consolidate(self):
+    m = Model('FAKE_MODEL_DIR/TestModel.ain2')
+    store = m.consolidate(ids=['1', '2', '3'], workers=2)
+    self.assertEqual(store.runs, ['1', '2'])
+    self.assertEqual(list(store.errors.keys()), ['3'])
+    self.assertEqual(len(store), 12)
+    expected, _ = m.load_runs(['1', '2'])
+    df = store.load()
+    pd.testing.assert_frame_equal(df.astype({'Line': str}), expected.astype({'Line': str}))
+    self.assertEqual(list(store.column('Value', run='2')), list(m.run('2').output['Value']))
+    self.assertIsInstance(store.column('Period'), np.memmap)
+    reserve = store.load(runs=['2'], columns=['Period', 'Value'], where={'Line': ['Reserve'], 'Period': 2})
+    self.assertEqual(list(reserve.columns), ['run', 'Period', 'Value'])
+    self.assertEqual(list(reserve['run']), ['2'])
+    # The store is reused while the output has not changed
+    self.assertEqual(os.stat(os.path.join(store.path, 'store.json')).st_mtime_ns, os.stat(os.path.join(m.consolidate(ids=['1', '2', '3']).path, 'store.json')).st_mtime_ns)
+    create_dummy_run('FAKE_MODEL_DIR', '3', 'Late', scale=2.0)
+    try:
+      store = m.consolidate(ids=['1', '2', '3'], dtype={'Value': 'float32'})
+      self.assertEqual(store.runs, ['1', '2', '3'])
+      self.assertEqual(store.errors, {})
+      self.assertEqual(str(store.column('Value').dtype), 'float32')
+    finally:
+      remove_dummy_run('FAKE_MODEL_DIR', '3')
+    # Rebuilds publish new versions, leaving open stores readable
+    values = store.column('Value')
+    for i in range(3):
+      latest = m.consolidate(ids=['1', '2'], rebuild=True)
+    self.assertNotEqual(latest.path, store.path)
+    self.assertEqual(len(values), 18)
+    self.assertEqual(latest.runs, ['1', '2'])
+    versions = [d for d in os.listdir(os.path.dirname(latest.path)) if os.path.isdir(os.path.join(os.path.dirname(latest.path), d))]
+    self.assertEqual(len(versions), 2)
+
+  def test_load_runs_dict(self):
+    m = Model('FAKE_MODEL_DIR/TestModel.ain2')
+    seen = []
+    frames, errors = m.load_runs(concat=False, executor='process', progress=lambda done, total, r: seen.append(done))
+    self.assertEqual(sorted(frames.keys()), ['1', '2'])
+    self.assertEqual(errors, {})
+    self.assertEqual(seen, [1, 2])
+
+  def test_reports(self):
+    m = Model('FAKE_MODEL_DIR/TestModel.ain2')
+    for report in ['010.Total002', '006.Subtotal002']:
+      shutil.copy(
+        os.path.join(m.dir, 'TestModel.Proj.2.Run.2.Rreq.006.Subtotal001.txt')
+        ,os.path.join(m.dir, 'TestModel.Proj.2.Run.2.Rreq.%s.txt'%report)
+      )
+    r = m.run('2')
+    self.assertEqual(sorted(r.reports), ['006.Subtotal001', '006.Subtotal002', '010.Total002'])
+    self.assertEqual(list(r.reports.index['level']), ['Subtotal', 'Subtotal', 'Total'])
+    frames = r.reports.load(['006.Subtotal002', '010.Total002'], workers=2)
+    pd.testing.assert_frame_equal(frames['010.Total002'], r.reports['006.Subtotal001'])
+    # Reports read together are kept, and not read again
+    self.assertIs(r.reports['010.Total002'], frames['010.Total002'])
+    self.assertIs(r.reports.load(['010.Total002'])['010.Total002'], frames['010.Total002'])
+    self.assertEqual(list(r.reports.load(['010.Total002'], columns=['Value'])['010.Total002'].columns), ['Value'])
+    # The usual subtotal is still the default output
+    self.assertIs(r.output, r.reports['006.Subtotal001'])
+    with self.assertRaises(KeyError):
+      r.reports['999.Total001']
+
+class Test_Portfolio(unittest.TestCase):
+  root = os.path.join('FAKE_MODEL_DIR', 'portfolio')
+
+  @classmethod
+  def setUpClass(cls):
+    synthetic.make_model(os.path.join(cls.root, '083120'), name='Assets', runs=2, periods=3, lines=2, logs=(), seed=1)
+    synthetic.make_model(os.path.join(cls.root, '093020'), name='Assets', runs=3, periods=3, lines=2, logs=(), seed=2)
+    synthetic.make_model(os.path.join(cls.root, '093020', 'Liabs'), name='Liabs', runs=1, periods=3, lines=2, logs=(), seed=3)
+
+  @classmethod
+  def tearDownClass(cls):
+    shutil.rmtree(cls.root)
+
+  def test_discovery(self):
+    p = Portfolio(self.root, workers=2)
+    self.assertEqual(list(p), ['083120/Assets', '093020/Assets', '093020/Liabs/Liabs'])
+    self.assertEqual(p['093020/Assets'].runs, ['1', '2', '3'])
+    self.assertEqual(p.folder('093020/Liabs/Liabs'), '093020/Liabs')
+
+  def test_query(self):
+    p = Portfolio(self.root)
+    df = p.runs_frame(workers=2)
+    self.assertEqual(len(df), 6)
+    self.assertEqual(list(df.index.names), ['model', 'run'])
+    self.assertEqual(list(p.query(folder='093020', ValuationDate='08/31/2020').index), [('093020/Assets', '1'), ('093020/Assets', '3')])
+
+  def test_load_runs(self):
+    p = Portfolio(self.root)
+    df, errors = p.load_runs(p.query(ProjectionDescription='Scenario 1'), workers=2, columns=['Line', 'Value'])
+    self.assertEqual(list(df.columns), ['model', 'run', 'Line', 'Value'])
+    self.assertEqual(list(df['model'].unique()), ['083120/Assets', '093020/Assets', '093020/Liabs/Liabs'])
+    self.assertEqual(len(df), 18)
+    pd.testing.assert_series_equal(df.loc[df['model'] == '093020/Assets', 'Value'].reset_index(drop=True), p['093020/Assets'].run('1').output['Value'])
+    loop = asyncio.new_event_loop()
+    try:
+      adf, aerrors = loop.run_until_complete(p.aload_runs([('083120/Assets', '1'), ('083120/Assets', '9'), ('093020/Assets', '1')], limit=2))
+    finally:
+      loop.close()
+    self.assertEqual(list(aerrors.keys()), [('083120/Assets', '9')])
+    self.assertEqual(list(adf['model'].unique()), ['083120/Assets', '093020/Assets'])
+    self.assertEqual(errors, {})
+
+class Test_CLI(unittest.TestCase):
+  pyalfa = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'pyalfa')
+
+  def cli(self, *args):
+    # Run the tool in a new interpreter, reporting whether it imported pandas
+    code = '\n'.join([
+      'import sys, runpy'
+      ,'sys.argv = %r'%(['pyalfa'] + list(args))
+      ,'try:'
+      ,'  runpy.run_path(%r, run_name="__main__")'%self.pyalfa
+      ,'except SystemExit as e:'
+      ,'  print("exit", e.code, "pandas" in sys.modules)'
+    ])
+    out = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    return out.stdout.splitlines()
+
+  def test_metadata_commands(self):
+    self.assertEqual(self.cli('runs', 'FAKE_MODEL_DIR/TestModel.ain2'), ['1', '2', 'exit 0 False'])
+    self.assertEqual(self.cli('locked', 'FAKE_MODEL_DIR'), ['unlocked', 'exit 0 False'])
+    out = self.cli('metadata', 'FAKE_MODEL_DIR/TestModel.ain2', '2')
+    self.assertEqual(out[-1], 'exit 0 False')
+    self.assertEqual(json.loads('\n'.join(out[:-1]))['2']['ProjectionDescription'], 'Sensitivity')
+
+  def test_export(self):
+    out = os.path.join('FAKE_MODEL_DIR', 'export.txt')
+    try:
+      self.assertEqual(self.cli('export', 'FAKE_MODEL_DIR/TestModel.ain2', out, '--columns', 'Line', 'Value'), ['exit 0 True'])
+      df = pd.read_csv(out, sep='\t')
+      self.assertEqual(list(df.columns), ['run', 'Line', 'Value'])
+      self.assertEqual(len(df), 12)
+    finally:
+      os.remove(out)
 
 if __name__=="__main__":
   create_dummy_model_folder(model_dir='FAKE_MODEL_DIR')